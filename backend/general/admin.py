@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Event, Booking, Review, EventTags, AllowedDM
+from .models import CustomUser, Event, Booking, Review, EventTags, AllowedDM, Job, EmailDelivery
 from django import forms
 from django.utils.safestring import mark_safe
+from .images import thumbnail
+from .search import filter_search
 
 class EventAdminForm(forms.ModelForm):
     class Meta:
@@ -18,6 +20,7 @@ class EventAdminForm(forms.ModelForm):
         html = ""
         for url in photos:
             if url:
+                url = thumbnail(url, self.instance.photo_variants)
                 full_url = url if url.startswith("/") else f"/media/{url}"
                 html += f'<img src="{full_url}" height="100" style="margin:5px; border:1px solid #ccc;" />'
         return mark_safe(html)
@@ -44,6 +47,12 @@ class EventAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index instead of LIKE '%term%' scans over search_fields
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return filter_search(queryset, search_term), False
+
     def photo_previews(self, obj):
         return EventAdminForm(instance=obj).render_photo_previews()
     photo_previews.short_description = "Photo Previews"
@@ -69,3 +78,17 @@ admin.site.register(Booking)
 admin.site.register(Review)
 admin.site.register(EventTags)
 admin.site.register(AllowedDM)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("kind", "status", "attempts", "run_after", "created_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("last_error",)
+
+
+@admin.register(EmailDelivery)
+class EmailDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("to", "subject", "status", "created_at")
+    list_filter = ("status",)
+    search_fields = ("to", "subject")
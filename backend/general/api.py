@@ -1,31 +1,43 @@
-import os
-from typing import List, Optional
+import logging
+from typing import Dict, List, Optional
 from django.contrib import auth
 from django.contrib.auth import authenticate, login, logout, get_user_model
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse, HttpResponse, HttpResponseForbidden
 from django.conf import settings
-from ninja import Router, Schema, File, Form
+from ninja import Router, Schema, File
 from ninja.files import UploadedFile
+from ninja.decorators import decorate_view
 from pydantic import constr
 from .models import Event, Booking, AllowedDM
 from ninja.errors import HttpError
 from datetime import datetime
 from . import models
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
+from .jobs import enqueue_email
+from django.db import IntegrityError, transaction
 from django.db.models import Q, F
 from .models import EventTags
 from datetime import datetime
 from django.utils import timezone
-from geopy.distance import geodesic
+from .geo import distances_within_radius
+from .reviews import apaginate, average_rating, rating_histogram
+from .search import filter_search, relevance
+from .images import photo_variants, profile_pic_variants
+from .uploads import media_url, store_upload
+from .cache import api_cache, conditional_get
+from .feed import feed
+from .metrics import registry
+from . import profiling
+from .events import (
+    events_with_tag_names, tags_prefetch, parse_fields, project_queryset,
+    serialize_event, paginate, stream_response, STREAM_CHUNK_SIZE,
+)
 import pytz
 
+logger = logging.getLogger(__name__)
 router = Router()
 UserModel = auth.get_user_model()
 
-UPLOAD_DIR = settings.MEDIA_ROOT  # instead of "/var/www/uploads/"
-  # Adjust as needed
-
 ### Custom JSON Response Handler
 def json_response(data, status=200):
     response = JsonResponse(data, status=status, safe=isinstance(data, dict))
@@ -58,11 +70,16 @@ class EventSchema(Schema):
     longitude: Optional[float] = None
     price: float
     photos: List[str] = []
+    photo_variants: List[Dict[str, str]] = []
+    thumbnail: Optional[str] = None
     number_of_guests: int
     number_of_bookings: int
     tags: List[str] = []
     external_booking_url: Optional[str] = None
-    
+    review_count: int = 0
+    average_rating: Optional[float] = None
+    distance_miles: Optional[float] = None
+
 
 
 class BookingSchema(Schema):
@@ -109,20 +126,11 @@ class StartDMSchema(Schema):
 ### File Upload API
 @router.post("/upload")
 def upload_file(request, file: UploadedFile = File(...), event_id: int = 0):
-    """Handles file uploads and stores them in a per-event subdirectory."""
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-
-    # Use event_id to create subdirectory
-    event_folder = os.path.join(UPLOAD_DIR, str(event_id))
-    os.makedirs(event_folder, exist_ok=True)
+    """Stores an upload once by content hash; identical files share one URL across events.
 
-    file_path = os.path.join(event_folder, file.name)
-
-    with open(file_path, "wb") as f:
-        f.write(file.read())
-
-    return json_response({"fileUrl": f"/media/{event_id}/{file.name}"})
+    `event_id` is accepted for older clients but no longer affects the path.
+    """
+    return json_response({"fileUrl": media_url(store_upload(file))})
 
 @router.patch("/event/id/{event_id}/update_photos")
 def update_event_photos(request, event_id: int, payload: PhotoUpdateSchema):
@@ -154,6 +162,7 @@ def get_current_user(request):
             "last_name": request.user.last_name,
             "bio": request.user.bio,
             "profile_pic": request.user.profile_pic.url if request.user.profile_pic else None,
+            "profile_pic_variants": profile_pic_variants(request.user),
             "is_traveler": request.user.is_traveler,
             "is_host": request.user.is_host
         }
@@ -187,11 +196,12 @@ def create_user(request):
         owner_user = UserModel.objects.get(email="experiencebylocals@gmail.com")
         user1, user2 = sorted([user, owner_user], key=lambda u: u.id)
         AllowedDM.objects.get_or_create(user1=user1, user2=user2)
-        print(f"✅ DM access granted between {user1.username} and {user2.username}")
+        logger.info("DM access granted between %s and %s", user1.username, user2.username)
     except UserModel.DoesNotExist:
-        print("⚠️ Owner user not found — skipping auto-DM setup")
+        logger.warning("Owner user not found, skipping auto-DM setup")
 
-    send_mail(
+    # Delivered by the job worker (manage.py run_jobs), not inside the request
+    enqueue_email(
         subject="Welcome to Local!",
         message=(
             f"Hi {user.first_name},\n\n"
@@ -200,9 +210,7 @@ def create_user(request):
             "Have questions or ideas? Just email us anytime at support@experiencebylocals.com.\n\n"
             "Cheers,\nThe Local Team"
         ),
-        from_email=None,  # Uses DEFAULT_FROM_EMAIL from settings
         recipient_list=[user.email],
-        fail_silently=False
     )
 
     return json_response({"message": "User created", "user_id": user.id})
@@ -263,12 +271,13 @@ def get_user_bookings(request):
     ]
 
 @router.get("/user/hosted_events")
-def get_user_events(request):
-    return list(Event.objects.filter(host=request.user).values())
+def get_user_events(request, stream: Optional[str] = None):
+    events = Event.objects.filter(host=request.user).values()
+    if stream:
+        return stream_response(events.iterator(chunk_size=STREAM_CHUNK_SIZE), stream)
+    return list(events)
 
 
-from django.http import QueryDict
-
 @router.post("/user/update")
 def update_user_profile(request):
     if not request.user.is_authenticated:
@@ -299,7 +308,9 @@ def update_user_profile(request):
 
 
 @router.get("/event/get_all", response=List[EventSchema])
-def list_filtered_events(request, 
+@decorate_view(conditional_get("events"))
+def list_filtered_events(request,
+                         response: HttpResponse,
                          date: Optional[str] = None,
                          date_after: Optional[str] = None,
                          date_before: Optional[str] = None,
@@ -311,74 +322,129 @@ def list_filtered_events(request,
                          sort_by_date: Optional[bool] = True,
                          user_lat: Optional[float] = None,
                          user_lon: Optional[float] = None,
-                         show_old: Optional[bool] = True):
-
-    # Start with only approved events in the future
-    qs = Event.objects.filter(approved=True)  # ✅ NEW: only include approved events
-    now = timezone.now()
-    if not show_old:
-        qs = qs.filter(occurence_date__gte=now)
+                         show_old: Optional[bool] = True,
+                         sort_by_distance: Optional[bool] = False,
+                         cursor: Optional[str] = None,
+                         limit: Optional[int] = None,
+                         fields: Optional[str] = None,
+                         stream: Optional[str] = None,
+                         q: Optional[str] = None):
+    """Approved events matching the filters.
+
+    Pass `limit` (and the `X-Next-Cursor` header of the previous page as
+    `cursor`) to page through results ordered by (occurence_date, id), and
+    `fields=id,title,occurence_date,thumbnail` to receive only those keys.
+    `stream=ndjson` or `stream=json` streams the full result set instead
+    (sort_by_distance is ignored there). `q` is a keyword search over title,
+    description, unique aspect, location and tags; unpaginated results are
+    then ordered by relevance. Requests using only show_old, tags_include,
+    tags_exclude, available_only, limit and cursor (the landing page and
+    its filter bar) are answered from the in-memory feed snapshot without
+    touching the event tables.
+    """
+
+    selected = parse_fields(fields)
+
+    snapshot = feed.snapshot() if feed.answers(request.GET, sort_by_date) else None
+    if snapshot is not None:
+        # Rows come pre-encoded from the snapshot (general/feed.py)
+        content, next_cursor = snapshot.page(
+            show_old, tags_include, tags_exclude, available_only, limit, cursor
+        )
+        response = HttpResponse(content, content_type="application/json")
+        response["Access-Control-Allow-Credentials"] = "true"
+        if next_cursor:
+            response["X-Next-Cursor"] = next_cursor
+        return response
 
-    if date:
-        from datetime import timedelta
-        from django.utils.timezone import make_aware
+    def filtered_events():
+        # Start with only approved events in the future
+        qs = Event.objects.filter(approved=True)  # ✅ NEW: only include approved events
+        now = timezone.now()
+        if not show_old:
+            qs = qs.filter(occurence_date__gte=now)
 
-        try:
-            parsed = datetime.strptime(date, "%Y-%m-%d")
-            mst = pytz.timezone("America/Denver")
-            start = mst.localize(parsed)
-            end = start + timedelta(days=1)
-            qs = qs.filter(occurence_date__gte=start, occurence_date__lt=end)
-        except ValueError:
-            pass
-
-    if date_after:
-        qs = qs.filter(occurence_date__gte=date_after)
-
-    if date_before:
-        qs = qs.filter(occurence_date__lte=date_before)
-
-    if available_only:
-        qs = qs.filter(number_of_bookings__lt=F("number_of_guests"))
-
-    if tags_include:
-        include_tags = tags_include.split(",")
-        qs = qs.filter(tags__tag_name__in=include_tags).distinct()
-
-    if tags_exclude:
-        exclude_tags = tags_exclude.split(",")
-        qs = qs.exclude(tags__tag_name__in=exclude_tags)
-
-    if user_lat is not None and user_lon is not None and radius is not None:
-        from geopy.distance import geodesic
-        user_coords = (user_lat, user_lon)
-        filtered_ids = []
-        for event in qs:
-            if event.latitude is not None and event.longitude is not None:
-                dist = geodesic(user_coords, (event.latitude, event.longitude)).miles
-                if dist <= radius:
-                    filtered_ids.append(event.id)
-        qs = qs.filter(id__in=filtered_ids)
-
-    if sort_by_date:
-        qs = qs.order_by("occurence_date")
+        if date:
+            from datetime import timedelta
 
-    return [
-        EventSchema(
-            id=event.id,
-            title=event.title,
-            description=event.description,
-            unique_aspect=event.unique_aspect,
-            occurence_date=str(event.occurence_date),
-            location=event.location or "",
-            price=float(event.price),
-            photos=event.photos or [],
-            number_of_guests=event.number_of_guests,
-            number_of_bookings=event.number_of_bookings,
-            tags=[tag.tag_name for tag in event.tags.all()]
+            try:
+                parsed = datetime.strptime(date, "%Y-%m-%d")
+                mst = pytz.timezone("America/Denver")
+                start = mst.localize(parsed)
+                end = start + timedelta(days=1)
+                qs = qs.filter(occurence_date__gte=start, occurence_date__lt=end)
+            except ValueError:
+                pass
+
+        if date_after:
+            qs = qs.filter(occurence_date__gte=date_after)
+
+        if date_before:
+            qs = qs.filter(occurence_date__lte=date_before)
+
+        if available_only:
+            qs = qs.filter(number_of_bookings__lt=F("number_of_guests"))
+
+        if tags_include:
+            include_tags = tags_include.split(",")
+            qs = qs.filter(id__in=events_with_tag_names(include_tags))
+
+        if tags_exclude:
+            exclude_tags = tags_exclude.split(",")
+            qs = qs.exclude(id__in=events_with_tag_names(exclude_tags))
+
+        if q:
+            qs = filter_search(qs, q)
+
+        distances = {}
+        if user_lat is not None and user_lon is not None and radius is not None:
+            distances = distances_within_radius(qs, user_lat, user_lon, radius)
+            qs = qs.filter(id__in=distances.keys())
+
+        return project_queryset(qs, selected), distances
+
+    paginated = bool(limit or cursor)
+
+    if stream and not paginated:
+        qs, distances = filtered_events()
+        if sort_by_date:
+            qs = qs.order_by("occurence_date")
+        return stream_response(
+            (serialize_event(event, selected, distances)
+             for event in qs.iterator(chunk_size=STREAM_CHUNK_SIZE)),
+            stream,
         )
-        for event in qs
-    ]
+
+    def build_page():
+        qs, distances = filtered_events()
+        next_cursor = None
+        if paginated:
+            # Keyset pages are always ordered by (occurence_date, id)
+            page, next_cursor = paginate(qs, cursor, limit)
+        else:
+            page = qs.order_by("occurence_date") if sort_by_date else qs
+
+        events = [serialize_event(event, selected, distances) for event in page]
+
+        if sort_by_distance and distances and not paginated:
+            # Off the distance map: fields= may leave distance_miles out of the rows
+            events.sort(key=lambda e: distances[e["id"]])
+        elif q and not paginated:
+            ranks = relevance(qs.db, q)
+            # sort() is stable, so equally relevant events keep date order
+            events.sort(key=lambda e: ranks.get(e["id"], 0.0))
+        return events, next_cursor
+
+    events, next_cursor = api_cache.get_or_set(
+        "event_list", ("events",), sorted(request.GET.lists()), build_page
+    )
+
+    if fields:
+        # Projected rows don't match EventSchema, so skip response validation
+        response = json_response(events)
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return response if fields else events
 
 
 
@@ -414,10 +480,18 @@ def create_event(request, payload: EventCreateSchema):
     return {"message": "Event created", "event_id": event.id}
 
 @router.get("/event/id/{event_id}")
-def get_event_by_id(request, event_id: int):
-    try:
-        event = Event.objects.get(id=event_id)
-        return json_response({
+@decorate_view(conditional_get("events", "users"))
+async def get_event_by_id(request, event_id: int):
+    async def build():
+        try:
+            event = await (
+                Event.objects.select_related("host")
+                .prefetch_related(tags_prefetch())
+                .aget(id=event_id)
+            )
+        except Event.DoesNotExist:
+            raise HttpError(404, "Event not found")
+        return {
             "id": event.id,
             "title": event.title,
             "description": event.description,
@@ -426,31 +500,40 @@ def get_event_by_id(request, event_id: int):
             "location": event.location or "",
             "price": float(event.price),
             "photos": event.photos or [],
+            "photo_variants": photo_variants(event),
             "host_first_name": event.host.first_name if event.host else "Unknown",
             "host_last_name": event.host.last_name if event.host else "",
             "host_profile_pic": event.host.profile_pic.url if event.host and event.host.profile_pic else "",
+            "host_profile_pic_variants": profile_pic_variants(event.host) if event.host else {},
             "host_id": event.host.id if event.host else None,
             "external_booking_url": event.external_booking_url,
-            "tags": [tag.tag_name for tag in event.tags.all()]
-        })
-    except Event.DoesNotExist:
-        raise HttpError(404, "Event not found")
+            "tags": [tag.tag_name for tag in event.tags.all()],
+            "review_count": event.review_count,
+            "average_rating": average_rating(event),
+            "rating_histogram": rating_histogram(event),
+        }
+
+    return json_response(await api_cache.aget_or_set("event", ("events", "users"), event_id, build))
 
 
 #  #Reviews 
 from .models import Review
 
 @router.get("/event/{event_id}/reviews", response=List[ReviewSchema])
-def list_reviews_for_event(request, event_id: int):
-    try:
-        event = models.Event.objects.get(id=event_id)
-    except models.Event.DoesNotExist:
+async def list_reviews_for_event(request, response: HttpResponse, event_id: int,
+                                 cursor: Optional[str] = None, limit: Optional[int] = None):
+    """Newest reviews first, `limit` (default 50) per page; pass the
+    `X-Next-Cursor` header back as `cursor` for the next page. Counts and
+    averages live on the event itself (review_count, average_rating)."""
+    if not await models.Event.objects.filter(id=event_id).aexists():
         raise HttpError(404, "Event not found")
 
-    return [
-        ReviewSchema(text=review.text, rating=review.rating)
-        for review in event.reviews.all()
-    ]
+    reviews, next_cursor = await apaginate(
+        Review.objects.filter(event_id=event_id).only("id", "text", "rating"), cursor, limit
+    )
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return [ReviewSchema(text=review.text, rating=review.rating) for review in reviews]
 
 
 @router.post("/booking/register/{event_id}")
@@ -464,14 +547,26 @@ def register_booking(request, event_id: int):
         raise HttpError(404, "Event not found")
 
     guest = request.user
-    booking, created = models.Booking.objects.get_or_create(event=event, guest=guest)
+    existing = models.Booking.objects.filter(event=event, guest=guest).first()
+    if existing:
+        return {"id": existing.id, "message": "Booking already exists"}
 
-    if created:
-        event.number_of_bookings += 1
-        event.save()
-        return {"id": booking.id, "message": "Booking created successfully"}
-
-    return {"id": booking.id, "message": "Booking already exists"}
+    try:
+        with transaction.atomic():
+            # Reserve a seat first: the conditional UPDATE is the capacity check
+            # and takes the write lock before anything else in the transaction.
+            reserved = models.Event.objects.filter(id=event.id).filter(
+                Q(number_of_guests__isnull=True) | Q(number_of_bookings__lt=F("number_of_guests"))
+            ).update(number_of_bookings=F("number_of_bookings") + 1)
+            if not reserved:
+                raise HttpError(409, "Event is fully booked")
+            booking = models.Booking.objects.create(event=event, guest=guest)
+    except IntegrityError:
+        # A concurrent request from the same guest won; its seat is the one kept
+        booking = models.Booking.objects.get(event=event, guest=guest)
+        return {"id": booking.id, "message": "Booking already exists"}
+
+    return {"id": booking.id, "message": "Booking created successfully"}
 
 @router.post("/reviews/create")
 def create_review(request, payload: ReviewCreateSchema):
@@ -486,11 +581,13 @@ def create_review(request, payload: ReviewCreateSchema):
     if not (1 <= payload.rating <= 5):
         raise HttpError(400, "Rating must be between 1 and 5")
 
-    review = models.Review.objects.create(
-        event=event,
-        text=payload.text,
-        rating=payload.rating
-    )
+    # The review and its event's aggregates (see signals) commit together
+    with transaction.atomic():
+        review = models.Review.objects.create(
+            event=event,
+            text=payload.text,
+            rating=payload.rating
+        )
 
     return json_response({
         "message": "Review created successfully",
@@ -503,10 +600,13 @@ def delete_booking(request, booking_id: int):
         return HttpResponseForbidden("Authentication required")
 
     booking = get_object_or_404(Booking, id=booking_id)
-    event = booking.event
-    booking.delete()
-    event.number_of_bookings = Booking.objects.filter(event=event).count()
-    event.save()
+    with transaction.atomic():
+        # Only the request that actually removed the row releases the seat
+        deleted, _ = Booking.objects.filter(id=booking.id).delete()
+        if deleted:
+            Event.objects.filter(id=booking.event_id, number_of_bookings__gt=0).update(
+                number_of_bookings=F("number_of_bookings") - 1
+            )
     return {"success": True}
 
 @router.delete("/event/delete/{event_id}")
@@ -532,6 +632,7 @@ def get_user_by_id(request, user_id: int):
             "last_name": user.last_name,
             "bio": user.bio,
             "profile_pic": user.profile_pic.url if user.profile_pic else None,
+            "profile_pic_variants": profile_pic_variants(user),
             "is_host": user.is_host,
             "is_traveler": user.is_traveler,
             "email": user.email
@@ -540,24 +641,28 @@ def get_user_by_id(request, user_id: int):
         raise HttpError(404, "User not found")
 
 @router.get("/host/{host_id}/events")
-def get_events_by_host_id(request, host_id: int):
-    try:
-        user = get_user_model().objects.get(id=host_id, is_host=True)
-    except UserModel.DoesNotExist:
-        raise HttpError(404, "Host not found")
-
-    events = Event.objects.filter(host=user)
-    return [
-        {
-            "id": event.id,
-            "title": event.title,
-            "occurence_date": str(event.occurence_date),
-            "location": event.location,
-            "number_of_bookings": event.number_of_bookings,
-            "photos": event.photos or [],
-        }
-        for event in events
-    ]
+async def get_events_by_host_id(request, host_id: int):
+    async def build():
+        try:
+            user = await get_user_model().objects.aget(id=host_id, is_host=True)
+        except UserModel.DoesNotExist:
+            raise HttpError(404, "Host not found")
+
+        events = Event.objects.filter(host=user)
+        return [
+            {
+                "id": event.id,
+                "title": event.title,
+                "occurence_date": str(event.occurence_date),
+                "location": event.location,
+                "number_of_bookings": event.number_of_bookings,
+                "photos": event.photos or [],
+                "photo_variants": photo_variants(event),
+            }
+            async for event in events
+        ]
+
+    return await api_cache.aget_or_set("host_events", ("events", "users"), host_id, build)
 
 @router.post("/messaging/start-dm")
 def start_dm(request, payload: StartDMSchema):
@@ -577,36 +682,78 @@ def start_dm(request, payload: StartDMSchema):
 
     return json_response({"message": f"Mutual DM access granted between {user1.username} and {user2.username}"})
 
+# Chat UIDs are usernames with "@" and "." removed
+CHAT_UID_STRIP = str.maketrans("", "", "@.")
+
+
 @router.get("/messaging/allowed-uids")
 def get_allowed_dms(request):
     if not request.user.is_authenticated:
         raise HttpError(401, "Unauthorized")
 
-    try:
-        dms = AllowedDM.objects.filter(
-            Q(user1=request.user) | Q(user2=request.user)
+    user_id = request.user.id
+
+    def build():
+        # Partner usernames from both sides of the pair in one UNION query
+        partners = AllowedDM.objects.filter(user1_id=user_id).values_list("user2__username", flat=True).union(
+            AllowedDM.objects.filter(user2_id=user_id).values_list("user1__username", flat=True)
         )
+        return [username.translate(CHAT_UID_STRIP) for username in partners]
 
+    # Invalidated per user when one of their AllowedDM rows changes (see signals)
+    return api_cache.get_or_set("allowed_dms", (f"dms:{user_id}",), user_id, build)
 
-        uids = []
+@router.get("/tags")
+@decorate_view(conditional_get("tags"))
+async def get_all_tags(request):
+    async def build():
+        return {"tags": [{"id": t.id, "tag_name": t.tag_name} async for t in EventTags.objects.all()]}
+
+    return json_response(await api_cache.aget_or_set("tags", ("tags",), (), build))
+
+
+@router.get("/cache/stats")
+def get_cache_stats(request):
+    """Hit/miss counters of this worker's API cache."""
+    if not request.user.is_staff:
+        raise HttpError(403, "Staff only")
+    return json_response(api_cache.stats())
+
+
+@router.get("/metrics")
+def get_metrics(request):
+    """Per-endpoint latency, SQL and size histograms of this worker, in Prometheus text format."""
+    token = settings.METRICS_TOKEN
+    scraper = token and request.headers.get("Authorization") == f"Bearer {token}"
+    if not (scraper or request.user.is_staff):
+        raise HttpError(403, "Staff only")
+
+    gauges = ("hit_ratio", "local_entries")
+    extra = [
+        (f"api_cache_{name}" if name in gauges else f"api_cache_{name}_total",
+         "gauge" if name in gauges else "counter", f"API cache {name.replace('_', ' ')}", value)
+        for name, value in api_cache.stats().items()
+    ]
+    return HttpResponse(registry.exposition(extra), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-        for dm in dms:
-            try:
-                other = dm.user2 if dm.user1 == request.user else dm.user1
-                uid = other.username.replace("@", "").replace(".", "")
-                uids.append(uid)
-            except Exception as e:
-                print(f"⚠️ Error processing AllowedDM ID={dm.id}: {e}")
 
-        return uids
+@router.get("/profiles")
+def list_profiles(request):
+    """Request profiles taken with the X-Profile header, newest first (staff only)."""
+    if not request.user.is_staff:
+        raise HttpError(403, "Staff only")
+    return json_response(profiling.list_profiles())
 
-    except Exception as outer_error:
-        import traceback
-        print("🔥 Critical error in get_allowed_dms API:")
-        print(traceback.format_exc())
-        raise HttpError(500, "Server failed to retrieve allowed users")
 
-@router.get("/tags")
-def get_all_tags(request):
-    tags = EventTags.objects.all()
-    return json_response({"tags": [{"id": t.id, "tag_name": t.tag_name} for t in tags]})
\ No newline at end of file
+@router.get("/profiles/{profile_id}")
+def download_profile(request, profile_id: str):
+    """Raw profile: pstats data (.prof) for cprofile, collapsed stacks (.folded) for sample."""
+    if not request.user.is_staff:
+        raise HttpError(403, "Staff only")
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HttpError(404, "Profile not found")
+    try:
+        return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
+    except FileNotFoundError:  # pruned since profile_path() found it
+        raise HttpError(404, "Profile not found")
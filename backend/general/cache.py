@@ -0,0 +1,261 @@
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class LocalLRU:
+    """Small thread-safe per-process LRU with a TTL on every entry."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionedCache:
+    """Read-through cache for API payloads keyed on per-namespace versions.
+
+    Every entry key embeds the current version of the namespaces it depends
+    on ("events", "tags", ...). Writes bump those versions (see signals.py),
+    which orphans every dependent entry at once instead of tracking keys.
+    Versions are nanosecond timestamps of the last change, so concurrent
+    bumps from different workers can never collapse into an old value and
+    the version doubles as a Last-Modified time.
+
+    Lookups go to a per-process LRU first, then the shared Django cache.
+    """
+
+    MISSING = object()
+
+    def __init__(self, alias="default", local_size=512, ttl=60):
+        self.alias = alias
+        self.ttl = ttl
+        self.local = LocalLRU(local_size, ttl)
+        self.hits = {"local": 0, "shared": 0}
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    ### Versions
+    def versions(self, namespaces):
+        keys = [f"version:{ns}" for ns in namespaces]
+        found = self.shared.get_many(keys)
+        for key in keys:
+            if key not in found:
+                # Cold or evicted: start a fresh version (add() keeps a concurrent one)
+                self.shared.add(key, time.time_ns(), None)
+                found[key] = self.shared.get(key)
+        return tuple(found[key] for key in keys)
+
+    async def aversions(self, namespaces):
+        keys = [f"version:{ns}" for ns in namespaces]
+        found = await self.shared.aget_many(keys)
+        for key in keys:
+            if key not in found:
+                await self.shared.aadd(key, time.time_ns(), None)
+                found[key] = await self.shared.aget(key)
+        return tuple(found[key] for key in keys)
+
+    def bump(self, *namespaces):
+        def apply():
+            now = time.time_ns()
+            self.shared.set_many({f"version:{ns}": now for ns in namespaces}, None)
+            self.invalidations += 1
+
+        apply()
+        # Bump again once the writing transaction commits, so a reader that
+        # cached pre-commit rows in between is orphaned as well.
+        if connection.in_atomic_block:
+            transaction.on_commit(apply)
+
+    ### Entries
+    @staticmethod
+    def entry_key(name, versions, parts):
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        return f"api:{name}:{'.'.join(str(v) for v in versions)}:{digest}"
+
+    def lookup_local(self, key):
+        value = self.local.get(key, self.MISSING)
+        if value is not self.MISSING:
+            self.hits["local"] += 1
+        return value
+
+    def get_or_set(self, name, namespaces, parts, compute):
+        """Return the cached payload for (name, parts) or compute and store it."""
+        key = self.entry_key(name, self.versions(namespaces), parts)
+
+        value = self.lookup_local(key)
+        if value is not self.MISSING:
+            return value
+
+        value = self.shared.get(key, self.MISSING)
+        if value is not self.MISSING:
+            self.hits["shared"] += 1
+            self.local.set(key, value)
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.shared.set(key, value, self.ttl)
+        self.local.set(key, value)
+        return value
+
+    async def aget_or_set(self, name, namespaces, parts, compute):
+        """Async get_or_set; compute is a coroutine function."""
+        key = self.entry_key(name, await self.aversions(namespaces), parts)
+
+        value = self.lookup_local(key)
+        if value is not self.MISSING:
+            return value
+
+        value = await self.shared.aget(key, self.MISSING)
+        if value is not self.MISSING:
+            self.hits["shared"] += 1
+            self.local.set(key, value)
+            return value
+
+        self.misses += 1
+        value = await compute()
+        await self.shared.aset(key, value, self.ttl)
+        self.local.set(key, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        hits = self.hits["local"] + self.hits["shared"]
+        lookups = hits + self.misses
+        return {
+            "hits_local": self.hits["local"],
+            "hits_shared": self.hits["shared"],
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "local_entries": len(self.local),
+        }
+
+
+api_cache = VersionedCache(
+    alias=settings.API_CACHE_ALIAS,
+    local_size=settings.API_CACHE_LOCAL_SIZE,
+    ttl=settings.API_CACHE_TTL,
+)
+
+
+# Filters whose results move with the clock even when no row changes
+TIME_RELATIVE_PARAMS = ("date", "date_after", "date_before")
+
+
+def is_time_relative(request):
+    params = request.GET
+    if params.get("show_old", "").lower() in ("false", "0", "no", "off"):
+        return True
+    return any(params.get(name) for name in TIME_RELATIVE_PARAMS)
+
+
+def conditional_validators(request, versions):
+    """(etag, last_modified) for a request whose payload depends on versions.
+
+    Only time-relative queries also roll every API_CACHE_TTL seconds; the
+    rest keep revalidating with a 304 until one of the versions moves.
+    """
+    last_modified = max([0] + [v // 1_000_000_000 for v in versions if v])
+    raw = f"{versions}:{request.get_full_path()}"
+    if is_time_relative(request):
+        bucket = int(time.time()) // api_cache.ttl * api_cache.ttl
+        last_modified = max(last_modified, bucket)
+        raw = f"{raw}:{bucket}"
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest()), last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Let browsers keep the body but revalidate on every use
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def conditional_get(*namespaces):
+    """Answer If-None-Match / If-Modified-Since with a 304 before the view runs.
+
+    Meant for `ninja.decorators.decorate_view`, on sync and async operations.
+    The ETag is derived from the namespace versions and the full request
+    path, never from the body, so a revalidation costs one version lookup.
+    Time-relative filters (show_old=false, date filters) are covered by also
+    rolling their validators every API_CACHE_TTL seconds.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view(request, *args, **kwargs)
+
+                etag, last_modified = conditional_validators(request, await api_cache.aversions(namespaces))
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                return set_validators(response, etag, last_modified)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = conditional_validators(request, api_cache.versions(namespaces))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return set_validators(response, etag, last_modified)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,170 @@
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from ninja.errors import HttpError
+
+from .images import photo_variants, thumbnail
+from .models import Event, EventTags
+from .reviews import average_rating
+
+MAX_PAGE_SIZE = 200
+
+
+# Load tag names for a whole page of events in one query instead of one per event
+def tags_prefetch():
+    return Prefetch("tags", queryset=EventTags.objects.only("id", "tag_name"))
+
+
+def events_with_tag_names(tag_names):
+    """Subquery of event ids carrying any of tag_names (no join + DISTINCT on Event)."""
+    return Event.tags.through.objects.filter(
+        eventtags__tag_name__in=tag_names
+    ).values("event_id")
+
+
+# field name -> (model columns it reads, getter)
+EVENT_FIELDS = {
+    "id": ((), lambda e: e.id),
+    "title": (("title",), lambda e: e.title),
+    "description": (("description",), lambda e: e.description),
+    "unique_aspect": (("unique_aspect",), lambda e: e.unique_aspect),
+    "occurence_date": (("occurence_date",), lambda e: str(e.occurence_date)),
+    "location": (("location",), lambda e: e.location or ""),
+    "latitude": (("latitude",), lambda e: e.latitude),
+    "longitude": (("longitude",), lambda e: e.longitude),
+    "price": (("price",), lambda e: float(e.price or 0)),
+    "photos": (("photos",), lambda e: e.photos or []),
+    "photo_variants": (("photos", "photo_variants"), photo_variants),
+    "thumbnail": (("photos", "photo_variants"), lambda e: thumbnail((e.photos or [None])[0], e.photo_variants)),
+    "number_of_guests": (("number_of_guests",), lambda e: e.number_of_guests),
+    "number_of_bookings": (("number_of_bookings",), lambda e: e.number_of_bookings),
+    "tags": ((), lambda e: [tag.tag_name for tag in e.tags.all()]),
+    "external_booking_url": (("external_booking_url",), lambda e: e.external_booking_url),
+    "review_count": (("review_count",), lambda e: e.review_count),
+    "average_rating": (("review_count", "rating_sum"), average_rating),
+}
+
+# distance_miles is computed by the radius filter, not read from the row
+PROJECTABLE_FIELDS = set(EVENT_FIELDS) | {"distance_miles"}
+
+DEFAULT_EVENT_FIELDS = list(EVENT_FIELDS) + ["distance_miles"]
+
+
+def parse_fields(fields):
+    """Validate a comma separated `fields=` projection; id is always included."""
+    if not fields:
+        return DEFAULT_EVENT_FIELDS
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = set(requested) - PROJECTABLE_FIELDS
+    if unknown:
+        raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return ["id"] + [name for name in requested if name != "id"]
+
+
+def project_queryset(qs, fields):
+    """Only select the columns (and prefetches) the requested fields read."""
+    columns = {"id", "occurence_date"}  # occurence_date feeds the page cursor
+    for name in fields:
+        if name in EVENT_FIELDS:
+            columns.update(EVENT_FIELDS[name][0])
+    qs = qs.only(*columns)
+    if "tags" in fields:
+        qs = qs.prefetch_related(tags_prefetch())
+    return qs
+
+
+def serialize_event(event, fields, distances=None):
+    data = {}
+    for name in fields:
+        if name == "distance_miles":
+            data[name] = (distances or {}).get(event.id)
+        else:
+            data[name] = EVENT_FIELDS[name][1](event)
+    return data
+
+
+### Keyset pagination on (occurence_date, id)
+def encode_cursor(event):
+    date = event.occurence_date.isoformat() if event.occurence_date else None
+    raw = json.dumps([date, event.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, event_id = json.loads(raw)
+        parsed = parse_datetime(date) if date else None
+        if date and parsed is None:
+            raise ValueError(date)
+        return parsed, int(event_id)
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+
+
+def keyset_order(qs):
+    # NULL dates first on every backend so the cursor predicate below holds
+    return qs.order_by(F("occurence_date").asc(nulls_first=True), "id")
+
+
+def after_cursor(qs, cursor):
+    date, event_id = decode_cursor(cursor)
+    if date is None:
+        return qs.filter(
+            Q(occurence_date__isnull=True, id__gt=event_id) | Q(occurence_date__isnull=False)
+        )
+    return qs.filter(
+        Q(occurence_date__gt=date) | Q(occurence_date=date, id__gt=event_id)
+    )
+
+
+def paginate(qs, cursor=None, limit=None):
+    """Return (events, next_cursor) for one page of a keyset-ordered queryset."""
+    limit = max(1, min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE))
+    qs = keyset_order(qs)
+    if cursor:
+        qs = after_cursor(qs, cursor)
+    events = list(qs[: limit + 1])
+    next_cursor = encode_cursor(events[limit - 1]) if len(events) > limit else None
+    return events[:limit], next_cursor
+
+
+### Streaming exports
+STREAM_CHUNK_SIZE = 500
+
+STREAM_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def stream_response(rows, stream_format):
+    """Stream an iterable of dicts as NDJSON or as one chunked JSON array.
+
+    Rows are encoded one at a time, so memory stays flat however many the
+    queryset iterator yields.
+    """
+    if stream_format not in STREAM_CONTENT_TYPES:
+        raise HttpError(400, f"Unsupported stream format: {stream_format}")
+
+    def encode(row):
+        return json.dumps(row, cls=DjangoJSONEncoder)
+
+    def ndjson():
+        for row in rows:
+            yield encode(row) + "\n"
+
+    def json_array():
+        yield "["
+        for index, row in enumerate(rows):
+            yield ("," if index else "") + encode(row)
+        yield "]"
+
+    body = ndjson() if stream_format == "ndjson" else json_array()
+    response = StreamingHttpResponse(body, content_type=STREAM_CONTENT_TYPES[stream_format])
+    response["Access-Control-Allow-Credentials"] = "true"
+    return response
@@ -0,0 +1,275 @@
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .cache import api_cache
+from .events import (
+    DEFAULT_EVENT_FIELDS, MAX_PAGE_SIZE, decode_cursor, encode_cursor, keyset_order,
+    project_queryset, serialize_event,
+)
+from .models import Event, FeedChange
+
+# Same dependency as the cached listing: event, booking, review, approval
+# and tag changes all bump "events" (see signals.py)
+NAMESPACES = ("events",)
+
+# Query parameters the snapshot can answer on its own: the landing page's
+# plain and filter-bar requests. Anything else (dates, radius, search,
+# fields=, streaming, ...) goes to the database as before. sort_by_date is
+# accepted only when true, its default.
+PARAMS = {"show_old", "tags_include", "tags_exclude", "available_only", "sort_by_date", "limit", "cursor"}
+
+# Beyond this many logged changes one full reload is cheaper than patching
+MAX_PATCH = 500
+# FeedChange keeps the newest KEEP_CHANGES rows, trimmed every PRUNE_EVERY.
+# A snapshot far enough behind to miss pruned rows sees more than MAX_PATCH
+# changes and reloads everything anyway.
+KEEP_CHANGES = 10_000
+PRUNE_EVERY = 1_000
+# Log ids are handed out before commit, so a slow transaction can land
+# behind a faster one: re-read this many ids below the newest seen
+LOG_LOOKBACK = 200
+
+# Sorts before every real date, like NULL in keyset_order()
+NO_DATE = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+def sort_key(date, event_id):
+    """Keyset position of (occurence_date, id), NULL dates first."""
+    return (date is not None, date or NO_DATE, event_id)
+
+
+def load_entries(qs, limit=None):
+    """(sort key, id, JSON row, tag names, has free seats) per approved event of qs, in feed order.
+
+    Rows are kept encoded, as the listing returns them: one bytes object
+    per event instead of a dict of Python values, and nothing to serialize
+    per request.
+    """
+    qs = keyset_order(project_queryset(qs.filter(approved=True), DEFAULT_EVENT_FIELDS))
+    if limit is not None:
+        qs = qs[:limit]
+    entries = []
+    for event in qs:
+        row = serialize_event(event, DEFAULT_EVENT_FIELDS)
+        entries.append((
+            sort_key(event.occurence_date, event.id),
+            event.id,
+            json.dumps(row, cls=DjangoJSONEncoder).encode(),
+            tuple(row["tags"]),
+            event.number_of_guests is not None and event.number_of_bookings < event.number_of_guests,
+        ))
+    return entries
+
+
+def bitset(ids):
+    """Int with bit n set for every event id n in ids."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    flags = bytearray(max(ids) // 8 + 1)
+    for event_id in ids:
+        flags[event_id >> 3] |= 1 << (event_id & 7)
+    return int.from_bytes(flags, "little")
+
+
+def members(bits):
+    """Byte view of a bitset; test an id with has(view, id)."""
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def has(view, event_id):
+    index = event_id >> 3
+    return index < len(view) and view[index] >> (event_id & 7) & 1
+
+
+class TagIndex:
+    """Tag name -> bitset of the ids of the events carrying it (bit n = event n).
+
+    The vocabulary is small (see seed_tags), so an include/exclude filter is
+    a handful of big-int ORs and ANDs instead of a join through the M2M
+    table. Built alongside each Snapshot, so it follows m2m_changed through
+    the FeedChange log like every other field.
+    """
+
+    def __init__(self, entries):
+        tagged = {}
+        for _, event_id, _, tags, _ in entries:
+            for name in tags:
+                tagged.setdefault(name, []).append(event_id)
+        self.bits = {name: bitset(ids) for name, ids in tagged.items()}
+
+    def any_of(self, names):
+        bits = 0
+        for name in names:
+            bits |= self.bits.get(name, 0)
+        return bits
+
+
+class _Position:
+    """The two attributes encode_cursor() reads off an event."""
+
+    def __init__(self, occurence_date, event_id):
+        self.occurence_date = occurence_date
+        self.id = event_id
+
+
+class Snapshot:
+    """Every approved event, encoded once, in (occurence_date, id) order.
+
+    Never modified once built; a sync produces a new Snapshot, so requests
+    keep reading the one they started with. An oversized snapshot holds no
+    events; it only records that there were more than FEED_MAX_EVENTS.
+    """
+
+    def __init__(self, entries, version, last_change, seen_changes, oversized=False):
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+        self.ids = [entry[1] for entry in entries]
+        self.rows = [entry[2] for entry in entries]
+        self.everything = bitset(self.ids)
+        self.available = bitset(entry[1] for entry in entries if entry[4])
+        self.tags = TagIndex(entries)
+        self.version = version
+        self.last_change = last_change
+        self.seen_changes = seen_changes
+        self.oversized = oversized
+
+    def matching(self, tags_include=None, tags_exclude=None, available_only=False):
+        """Bitset of the events passing the tag and availability filters, or None for all."""
+        bits = self.tags.any_of(tags_include.split(",")) if tags_include else None
+        if available_only:
+            bits = self.available if bits is None else bits & self.available
+        if tags_exclude:
+            bits = (self.everything if bits is None else bits) & ~self.tags.any_of(tags_exclude.split(","))
+        return bits
+
+    def page(self, show_old=True, tags_include=None, tags_exclude=None,
+             available_only=False, limit=None, cursor=None):
+        """Return (JSON array bytes, next_cursor) like the database path of the listing."""
+        start = 0
+        if cursor:
+            date, event_id = decode_cursor(cursor)
+            start = bisect_right(self.keys, sort_key(date, event_id))
+        if not show_old:
+            start = max(start, bisect_left(self.keys, sort_key(timezone.now(), 0)))
+
+        bits = self.matching(tags_include, tags_exclude, available_only)
+        view = None if bits is None else members(bits)
+
+        paginated = bool(limit or cursor)
+        limit = max(1, min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)) if paginated else len(self.rows)
+        matches = []
+        for index in range(start, len(self.rows)):
+            if view is not None and not has(view, self.ids[index]):
+                continue
+            matches.append(index)
+            if len(matches) > limit:
+                break
+
+        next_cursor = None
+        if paginated and len(matches) > limit:
+            has_date, date, event_id = self.keys[matches[limit - 1]]
+            next_cursor = encode_cursor(_Position(date if has_date else None, event_id))
+        matches = matches[:limit]
+        return b"[" + b", ".join(self.rows[index] for index in matches) + b"]", next_cursor
+
+
+class Feed:
+    """Per-process snapshot of the public event listing.
+
+    Checked against the "events" version on every read, at the cost of an
+    API cache lookup. When the version moved, only the events logged in
+    FeedChange since the last sync are reloaded and patched in (signals.py
+    logs every write inside the writer's transaction); a NULL entry or a
+    big batch reloads everything. A version bumped before its transaction
+    commits finds nothing new in the log yet; the bump that follows the
+    commit does.
+
+    Each worker holds its own copy, so past settings.FEED_MAX_EVENTS
+    approved events the snapshot steps aside and the listing reads the
+    database again.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+
+    def snapshot(self):
+        """The current Snapshot, or None while there are too many events to hold."""
+        version = api_cache.versions(NAMESPACES)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self.sync(snapshot, version)
+        return None if snapshot.oversized else snapshot
+
+    def sync(self, snapshot, version):
+        if snapshot is None:
+            return self.rebuild(version)
+        if snapshot.oversized:
+            # A count is far cheaper than a reload that would be thrown away
+            if Event.objects.filter(approved=True).count() > settings.FEED_MAX_EVENTS:
+                return Snapshot([], version, snapshot.last_change, snapshot.seen_changes, oversized=True)
+            return self.rebuild(version)
+
+        log = FeedChange.objects.filter(id__gt=snapshot.last_change - LOG_LOOKBACK).order_by("id")
+        changes = [
+            (change_id, event_id)
+            for change_id, event_id in log.values_list("id", "event_id")[: LOG_LOOKBACK + MAX_PATCH + 1]
+            if change_id not in snapshot.seen_changes
+        ]
+        changed = {event_id for _, event_id in changes}
+        if None in changed or len(changes) > MAX_PATCH:
+            return self.rebuild(version)
+
+        entries = snapshot.entries
+        if changed:
+            kept = [entry for entry in entries if entry[1] not in changed]
+            # Two sorted runs, so timsort merges them in linear time
+            entries = sorted(kept + load_entries(Event.objects.filter(id__in=changed)), key=lambda e: e[0])
+            if len(entries) > settings.FEED_MAX_EVENTS:
+                return self.rebuild(version)
+        seen = snapshot.seen_changes | {change_id for change_id, _ in changes}
+        last_change = max(seen, default=snapshot.last_change)
+        seen = {change_id for change_id in seen if change_id > last_change - LOG_LOOKBACK}
+        self.prune(last_change)
+        return Snapshot(entries, version, last_change, seen)
+
+    def rebuild(self, version):
+        """Reload every approved event, or mark the snapshot oversized."""
+        # Log position first: changes landing during the load are replayed by the next sync
+        newest = RawSQL(f"(SELECT MAX(id) FROM {FeedChange._meta.db_table}) - %s", (LOG_LOOKBACK,))
+        seen = set(FeedChange.objects.filter(id__gt=newest).values_list("id", flat=True))
+        last_change = max(seen, default=0)
+        entries = load_entries(Event.objects.all(), limit=settings.FEED_MAX_EVENTS + 1)
+        self.prune(last_change)
+        if len(entries) > settings.FEED_MAX_EVENTS:
+            return Snapshot([], version, last_change, seen, oversized=True)
+        return Snapshot(entries, version, last_change, seen)
+
+    def prune(self, last_change):
+        """Trim FeedChange to its newest KEEP_CHANGES rows, once every PRUNE_EVERY changes."""
+        if last_change - self._pruned_at > PRUNE_EVERY:
+            FeedChange.objects.filter(id__lte=last_change - KEEP_CHANGES).delete()
+            self._pruned_at = last_change
+
+    def reset(self):
+        self._snapshot = None
+
+    @staticmethod
+    def answers(params, sort_by_date=True):
+        """Whether a listing request only filters what the snapshot indexes."""
+        return sort_by_date and set(params) <= PARAMS
+
+
+feed = Feed()
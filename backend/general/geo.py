@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+EARTH_RADIUS_MILES = 3958.7613
+METERS_PER_MILE = 1609.344
+
+# Widen the bounding box slightly so rounding at its edges never drops a
+# true match; the exact distance check runs on the candidates afterwards.
+BBOX_PADDING = 1.01
+
+
+def bounding_box(lat, lon, radius_miles):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing the search circle.
+
+    When the box crosses the antimeridian min_lon is greater than max_lon.
+    """
+    angular = (radius_miles * BBOX_PADDING) / EARTH_RADIUS_MILES
+    delta_lat = math.degrees(angular)
+    min_lat, max_lat = lat - delta_lat, lat + delta_lat
+
+    # Circle touches a pole: every longitude is a candidate
+    if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    ratio = math.sin(angular) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return min_lat, max_lat, -180.0, 180.0
+    delta_lon = math.degrees(math.asin(ratio))
+
+    min_lon, max_lon = lon - delta_lon, lon + delta_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def filter_bounding_box(qs, lat, lon, radius_miles):
+    """Restrict an Event queryset to rows inside the radius bounding box.
+
+    Runs against the (latitude, longitude) index, so only nearby rows
+    ever leave the database.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_miles)
+    qs = qs.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon <= max_lon:
+        if (min_lon, max_lon) != (-180.0, 180.0):
+            qs = qs.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+        else:
+            qs = qs.filter(longitude__isnull=False)
+    else:
+        qs = qs.filter(Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+    return qs
+
+
+def haversine_miles(lat, lon, lats, lons):
+    """Great-circle distance in miles from (lat, lon) to every point in lats/lons.
+
+    Vectorized over the whole candidate set; within ~0.5% of the ellipsoidal
+    geodesic distance geopy reports.
+    """
+    lat1 = math.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def uses_postgis(qs):
+    return getattr(connections[qs.db].ops, "postgis", False)
+
+
+def postgis_distances_within_radius(qs, lat, lon, radius_miles):
+    """ST_DWithin on the GiST-indexed `point` column (see migration 0009)."""
+    column = f'"{qs.model._meta.db_table}"."point"'
+    origin = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography"
+    within = RawSQL(
+        f"ST_DWithin({column}, {origin}, %s)",
+        (lon, lat, radius_miles * METERS_PER_MILE),
+        output_field=BooleanField(),
+    )
+    distance = RawSQL(f"ST_Distance({column}, {origin})", (lon, lat), output_field=FloatField())
+    rows = qs.filter(within).annotate(distance_m=distance).values_list("id", "distance_m")
+    return {event_id: meters / METERS_PER_MILE for event_id, meters in rows}
+
+
+def distances_within_radius(qs, lat, lon, radius_miles):
+    """Map event id -> distance in miles for events of qs inside the radius.
+
+    On PostGIS the database does all of the work. Elsewhere: bounding-box
+    prefilter in SQL, one vectorized distance pass over the candidates.
+    """
+    if uses_postgis(qs):
+        return postgis_distances_within_radius(qs, lat, lon, radius_miles)
+
+    candidates = filter_bounding_box(qs, lat, lon, radius_miles)
+    rows = list(candidates.values_list("id", "latitude", "longitude"))
+    if not rows:
+        return {}
+    ids, lats, lons = zip(*rows)
+    distances = haversine_miles(lat, lon, lats, lons)
+    return {
+        event_id: float(dist)
+        for event_id, dist in zip(ids, distances)
+        if dist <= radius_miles
+    }
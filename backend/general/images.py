@@ -0,0 +1,139 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .cache import api_cache
+from .models import Event, FeedChange
+
+logger = logging.getLogger(__name__)
+
+# variant name -> longest edge in pixels
+SIZES = {
+    "thumb": 320,   # listing cards, avatars
+    "card": 800,    # detail pages
+}
+QUALITY = {"webp": 80, "avif": 60}
+DERIVED_DIR = "derived"
+
+
+def enabled_formats():
+    """Formats from IMAGE_DERIVATIVE_FORMATS this Pillow build can actually encode."""
+    return [fmt for fmt in settings.IMAGE_DERIVATIVE_FORMATS if fmt in QUALITY and features.check(fmt)]
+
+
+def local_path(url):
+    """Filesystem path of a /media/ URL, or None for external or unsafe URLs."""
+    if not url or not url.startswith(settings.MEDIA_URL):
+        return None
+    relative = url[len(settings.MEDIA_URL):]
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, relative))
+    return path if path.startswith(root + os.sep) else None
+
+
+def pending(urls, variants):
+    """Local image URLs that have no derivative entry yet."""
+    return [url for url in urls if url not in variants and local_path(url)]
+
+
+def derivative_name(url, size_name, fmt):
+    # Derivatives sit at a fixed path next to each other, so content-addressed
+    # sources shared by several events also share their derivatives
+    stem = os.path.splitext(url[len(settings.MEDIA_URL):])[0]
+    return f"{DERIVED_DIR}/{stem}/{size_name}.{fmt}"
+
+
+def build_derivatives(url, force=False):
+    """Write every size/format of one source image; returns {"thumb.webp": url, ...}.
+
+    Existing files are reused unless `force`. Missing or unreadable sources
+    produce an empty dict so they aren't retried on every save.
+    """
+    source = local_path(url)
+    formats = enabled_formats()
+    names = {
+        f"{size_name}.{fmt}": derivative_name(url, size_name, fmt)
+        for size_name in SIZES for fmt in formats
+    }
+    if source is None or not names:
+        return {}
+    if not force and all(os.path.exists(os.path.join(settings.MEDIA_ROOT, n)) for n in names.values()):
+        return {key: settings.MEDIA_URL + name for key, name in names.items()}
+
+    try:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ("RGB", "RGBA"):
+                original = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+            for size_name, edge in SIZES.items():
+                resized = original.copy()
+                resized.thumbnail((edge, edge), Image.LANCZOS)  # never upscales
+                for fmt in formats:
+                    save_atomic(resized, os.path.join(settings.MEDIA_ROOT, names[f"{size_name}.{fmt}"]), fmt)
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Cannot build derivatives for %s", url, exc_info=True)
+        return {}
+    return {key: settings.MEDIA_URL + name for key, name in names.items()}
+
+
+def save_atomic(image, path, fmt):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as out:
+            image.save(out, format=fmt.upper(), quality=QUALITY[fmt])
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def variants_for(urls, current=None, force=False):
+    """Derivatives for a list of source URLs, reusing entries already in `current`."""
+    current = current or {}
+    return {
+        url: current[url] if url in current and not force else build_derivatives(url, force)
+        for url in urls
+        if local_path(url)
+    }
+
+
+def thumbnail(url, variants, size_name="thumb"):
+    """Smallest suitable URL for `url`: its derivative if built, else the original."""
+    built = (variants or {}).get(url) or {}
+    for fmt in settings.IMAGE_DERIVATIVE_FORMATS:
+        if f"{size_name}.{fmt}" in built:
+            return built[f"{size_name}.{fmt}"]
+    return url
+
+
+def photo_variants(event):
+    """Derivatives aligned with event.photos ({} for photos not processed yet)."""
+    return [event.photo_variants.get(url, {}) for url in event.photos or []]
+
+
+def profile_pic_variants(user):
+    return user.profile_pic_variants.get(user.profile_pic.url, {}) if user.profile_pic else {}
+
+
+### Per-model entry points (used by the image_derivatives job and the backfill command)
+def refresh_event(event, force=False):
+    variants = variants_for(event.photos or [], event.photo_variants, force)
+    # update() rather than save() so the post_save hook doesn't enqueue again
+    Event.objects.filter(id=event.id).update(photo_variants=variants)
+    FeedChange.record(event.id)
+    api_cache.bump("events")
+    return variants
+
+
+def refresh_user(user, force=False):
+    urls = [user.profile_pic.url] if user.profile_pic else []
+    variants = variants_for(urls, user.profile_pic_variants, force)
+    get_user_model().objects.filter(id=user.id).update(profile_pic_variants=variants)
+    api_cache.bump("users")
+    return variants
@@ -0,0 +1,144 @@
+import logging
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage
+from django.db.models import Q
+from django.utils import timezone
+
+from . import images
+from .mail import mailer
+from .models import Event, Job
+
+logger = logging.getLogger(__name__)
+
+# kind -> (handler, batched)
+HANDLERS = {}
+
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+# A running job whose worker died is picked up again after this long
+LEASE_SECONDS = 15 * 60
+
+
+def job(kind, batch=False):
+    """Register a handler for `kind`.
+
+    Plain handlers are called with one payload dict. Batch handlers get the
+    list of payloads claimed together and return one error (or None) per
+    payload, so a single bad message doesn't retry the whole batch.
+    """
+    def register(func):
+        HANDLERS[kind] = (func, batch)
+        return func
+    return register
+
+
+def enqueue(kind, **payload):
+    """Persist a job; it runs once the surrounding transaction commits."""
+    if kind not in HANDLERS:
+        raise ValueError(f"No job handler registered for {kind!r}")
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def claim(batch_size):
+    """Atomically move up to batch_size due jobs to RUNNING and return them."""
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_after__lte=now) | Q(
+        status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=LEASE_SECONDS)
+    )
+    candidates = Job.objects.filter(due).order_by("run_after", "id").values("id")[:batch_size]
+    # One UPDATE with the due guard: rows a concurrent worker already took are skipped
+    claimed = Job.objects.filter(due, id__in=candidates).update(status=Job.RUNNING, locked_at=now)
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status=Job.RUNNING, locked_at=now).order_by("run_after", "id"))
+
+
+def finish(entry, error=None):
+    entry.attempts += 1
+    entry.locked_at = None
+    if error is None:
+        entry.status = Job.DONE
+        entry.finished_at = timezone.now()
+        entry.last_error = ""
+    elif entry.attempts >= entry.max_attempts:
+        entry.status = Job.FAILED
+        entry.finished_at = timezone.now()
+        entry.last_error = error
+    else:
+        entry.status = Job.PENDING
+        entry.run_after = timezone.now() + backoff(entry.attempts)
+        entry.last_error = error
+    entry.save(update_fields=["attempts", "locked_at", "status", "finished_at", "last_error", "run_after"])
+
+
+def run_pending(batch_size=50):
+    """Run one batch of due jobs; returns how many were processed."""
+    jobs = claim(batch_size)
+    by_kind = defaultdict(list)
+    for claimed in jobs:
+        by_kind[claimed.kind].append(claimed)
+
+    for kind, group in by_kind.items():
+        if kind not in HANDLERS:
+            for claimed in group:
+                finish(claimed, f"No job handler registered for {kind!r}")
+            continue
+
+        handler, batched = HANDLERS[kind]
+        if batched:
+            try:
+                errors = handler([claimed.payload for claimed in group])
+            except Exception:
+                errors = [traceback.format_exc()] * len(group)
+            for claimed, error in zip(group, errors):
+                finish(claimed, error)
+        else:
+            for claimed in group:
+                try:
+                    handler(claimed.payload)
+                    finish(claimed)
+                except Exception:
+                    logger.exception("Job %s failed", claimed)
+                    finish(claimed, traceback.format_exc())
+    return len(jobs)
+
+
+### Handlers
+@job("send_email", batch=True)
+def send_emails(payloads):
+    """Send a batch of emails over the worker's pooled SMTP connection."""
+    return mailer.send([
+        EmailMessage(
+            subject=payload["subject"],
+            body=payload["message"],
+            from_email=payload.get("from_email"),  # None uses DEFAULT_FROM_EMAIL
+            to=payload["recipient_list"],
+        )
+        for payload in payloads
+    ])
+
+
+@job("image_derivatives")
+def image_derivatives(payload):
+    """Build resized WebP/AVIF versions of an event's photos or a user's profile picture."""
+    if payload["model"] == "event":
+        instance = Event.objects.filter(id=payload["id"]).first()
+        refresh = images.refresh_event
+    else:
+        instance = get_user_model().objects.filter(id=payload["id"]).first()
+        refresh = images.refresh_user
+    if instance is not None:  # deleted since it was queued
+        refresh(instance, force=payload.get("force", False))
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    return enqueue("send_email", subject=subject, message=message,
+                   recipient_list=recipient_list, from_email=from_email)
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .models import EmailDelivery
+
+logger = logging.getLogger(__name__)
+
+
+class PooledMailer:
+    """Sends email over one long-lived SMTP connection, in rate-limited batches.
+
+    Opening a connection costs a TCP + STARTTLS + AUTH round trip to the
+    relay, so the connection is kept open between batches and only recycled
+    after `max_per_connection` messages, `idle_timeout` seconds without use,
+    or an error. Messages of a batch go out one by one on that connection,
+    so each gets its own outcome and a failure is never resent to the
+    recipients before it.
+    """
+
+    def __init__(self, batch_size=50, rate_per_second=None, max_per_connection=500,
+                 idle_timeout=60, record=True, connection_factory=None):
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+        self.max_per_connection = max_per_connection
+        self.idle_timeout = idle_timeout
+        self.record = record
+        self.connection_factory = connection_factory or (lambda: get_connection(fail_silently=False))
+        self._connection = None
+        self._sent_on_connection = 0
+        self._last_used = 0.0
+        self._next_send_at = 0.0
+        self._lock = threading.Lock()
+
+    ### Connection pool (of one)
+    def connection(self):
+        stale = time.monotonic() - self._last_used > self.idle_timeout
+        if self._connection is not None and (stale or self._sent_on_connection >= self.max_per_connection):
+            self.close()
+        if self._connection is None:
+            self._connection = self.connection_factory()
+            self._connection.open()
+            self._sent_on_connection = 0
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                logger.warning("Error closing SMTP connection", exc_info=True)
+            self._connection = None
+
+    def throttle(self, count):
+        if not self.rate_per_second:
+            return
+        now = time.monotonic()
+        if self._next_send_at > now:
+            time.sleep(self._next_send_at - now)
+        self._next_send_at = max(now, self._next_send_at) + count / self.rate_per_second
+
+    ### Sending
+    def send(self, messages):
+        """Send EmailMessages; returns one error string (or None) per message."""
+        outcomes = []
+        with self._lock:
+            for start in range(0, len(messages), self.batch_size):
+                batch = messages[start:start + self.batch_size]
+                self.throttle(len(batch))
+                outcomes += self.send_batch(batch)
+        if self.record:
+            self.record_outcomes(messages, outcomes)
+        return outcomes
+
+    def send_batch(self, batch):
+        # One message per call on the pooled connection: send_messages() stops
+        # at the first failure without saying which messages already went out,
+        # so retrying a whole batch would mail the earlier recipients twice.
+        outcomes = []
+        for message in batch:
+            try:
+                self.connection().send_messages([message])
+                self._sent_on_connection += 1
+                self._last_used = time.monotonic()
+                outcomes.append(None)
+            except Exception as e:
+                logger.warning("Email to %s failed", ", ".join(message.to), exc_info=True)
+                # The next message goes out on a fresh connection
+                self.close()
+                outcomes.append(f"{e.__class__.__name__}: {e}")
+        return outcomes
+
+    @staticmethod
+    def record_outcomes(messages, outcomes):
+        EmailDelivery.objects.bulk_create([
+            EmailDelivery(
+                to=", ".join(message.to)[:500],
+                subject=message.subject[:255],
+                status=EmailDelivery.SENT if error is None else EmailDelivery.FAILED,
+                error=error or "",
+            )
+            for message, error in zip(messages, outcomes)
+        ])
+
+
+# One per process: the job worker reuses its SMTP connection across batches
+mailer = PooledMailer(
+    batch_size=settings.EMAIL_BATCH_SIZE,
+    rate_per_second=settings.EMAIL_RATE_LIMIT,
+)
@@ -0,0 +1,374 @@
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from general.api import router
+from general import profiling
+from general.cache import api_cache
+from general.feed import feed
+from general.models import AllowedDM, Booking, Event, EventTags, Review
+
+from .seed_data import PASSWORD
+
+PREFIX = "/api/general"
+# Slowdowns smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 1.0
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Scenario:
+    """One request against one router operation.
+
+    `route` is the router path template the scenario covers; `request`
+    builds the Client call from the fixtures, so ids resolve per database.
+    """
+
+    def __init__(self, name, method, route, request, auth=None):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.request = request
+        self.auth = auth
+
+
+def scenarios():
+    today = timezone.localdate().isoformat()
+    return [
+        Scenario("health", "GET", "/health", lambda f: ("/health", {})),
+        Scenario("tags", "GET", "/tags", lambda f: ("/tags", {})),
+        Scenario("events_all", "GET", "/event/get_all", lambda f: ("/event/get_all", {})),
+        Scenario("events_page", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"limit": 20, "show_old": "false"}})),
+        Scenario("events_available", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"limit": 20, "available_only": "true"}})),
+        Scenario("events_tags", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"limit": 20, "tags_include": f["tag"]}})),
+        Scenario("events_radius", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {
+                     "user_lat": 39.7392, "user_lon": -104.9903, "radius": 25, "sort_by_distance": "true",
+                 }})),
+        Scenario("events_search", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"q": "jazz", "limit": 20}})),
+        Scenario("events_date", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"date": today}})),
+        Scenario("events_fields", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"limit": 50, "fields": "id,title,occurence_date,thumbnail"}})),
+        Scenario("events_feed", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"tags_include": f["tag"], "sort_by_date": "true"}})),
+        Scenario("events_stream", "GET", "/event/get_all",
+                 lambda f: ("/event/get_all", {"data": {"stream": "ndjson"}})),
+        Scenario("event_detail", "GET", "/event/id/{event_id}", lambda f: (f"/event/id/{f['event'].id}", {})),
+        Scenario("event_reviews", "GET", "/event/{event_id}/reviews",
+                 lambda f: (f"/event/{f['event'].id}/reviews", {})),
+        Scenario("host_events", "GET", "/host/{host_id}/events", lambda f: (f"/host/{f['host'].id}/events", {})),
+        Scenario("user_by_id", "GET", "/user/{user_id}", lambda f: (f"/user/{f['host'].id}", {})),
+        Scenario("current_user", "GET", "/user", lambda f: ("/user", {}), auth="guest"),
+        Scenario("user_bookings", "GET", "/user/bookings", lambda f: ("/user/bookings", {}), auth="guest"),
+        Scenario("hosted_events", "GET", "/user/hosted_events", lambda f: ("/user/hosted_events", {}), auth="host"),
+        Scenario("allowed_dms", "GET", "/messaging/allowed-uids", lambda f: ("/messaging/allowed-uids", {}),
+                 auth="guest"),
+        Scenario("cache_stats", "GET", "/cache/stats", lambda f: ("/cache/stats", {}), auth="staff"),
+        Scenario("metrics", "GET", "/metrics", lambda f: ("/metrics", {}), auth="staff"),
+        Scenario("profiles", "GET", "/profiles", lambda f: ("/profiles", {}), auth="staff"),
+        Scenario("profile_download", "GET", "/profiles/{profile_id}",
+                 lambda f: (f"/profiles/{f['profile_id']}", {}), auth="staff"),
+        Scenario("events_radius_sampled", "GET", "/event/get_all", lambda f: ("/event/get_all", {
+            "data": {"user_lat": 39.7392, "user_lon": -104.9903, "radius": 25}, "HTTP_X_PROFILE": "sample",
+        }), auth="staff"),
+        Scenario("user_create", "POST", "/user/create", lambda f: ("/user/create", {"data": {
+            "username": f"bench_{uuid.uuid4().hex[:12]}", "password": "bench-password",
+            "email": "bench@example.com", "first_name": "Bench", "last_name": "User",
+        }})),
+        Scenario("authenticate", "POST", "/user/authenticate", lambda f: ("/user/authenticate", {
+            "data": {"username": f["guest"].username, "password": PASSWORD}, "content_type": "application/json",
+        })),
+        Scenario("logout", "POST", "/user/logout", lambda f: ("/user/logout", {}), auth="guest"),
+        Scenario("user_update", "POST", "/user/update",
+                 lambda f: ("/user/update", {"data": {"first_name": "Bench", "bio": "Benchmarking"}}), auth="guest"),
+        Scenario("upload", "POST", "/upload", lambda f: ("/upload", {"data": {
+            "file": SimpleUploadedFile("bench.txt", b"bench upload payload", content_type="text/plain"),
+        }})),
+        Scenario("update_photos", "PATCH", "/event/id/{event_id}/update_photos",
+                 lambda f: (f"/event/id/{f['event'].id}/update_photos", {
+                     "data": {"photos": ["/media/bench.jpg"]}, "content_type": "application/json",
+                 })),
+        Scenario("event_create", "POST", "/event/create", lambda f: ("/event/create", {"data": {
+            "title": "Bench event", "description": "Benchmark", "unique_aspect": "None",
+            "occurence_date": (timezone.now() + timedelta(days=7)).isoformat(),
+            "location": "Denver, CO", "latitude": 39.74, "longitude": -104.99, "price": 10,
+            "number_of_guests": 10, "number_of_bookings": 0, "photos": [], "tags": [f["tag_id"]],
+            "external_booking_url": "",
+        }, "content_type": "application/json"}), auth="host"),
+        Scenario("booking_register", "POST", "/booking/register/{event_id}",
+                 lambda f: (f"/booking/register/{f['open_event'].id}", {}), auth="guest"),
+        Scenario("booking_delete", "DELETE", "/booking/delete/{booking_id}",
+                 lambda f: (f"/booking/delete/{f['booking'].id}", {}), auth="guest"),
+        Scenario("review_create", "POST", "/reviews/create", lambda f: ("/reviews/create", {
+            "data": {"event_id": f["event"].id, "text": "Benchmark review", "rating": 4},
+            "content_type": "application/json",
+        }), auth="guest"),
+        Scenario("dm_start", "POST", "/messaging/start-dm", lambda f: ("/messaging/start-dm", {
+            "data": {"target_user_id": f["stranger"].id}, "content_type": "application/json",
+        }), auth="guest"),
+        Scenario("event_delete", "DELETE", "/event/delete/{event_id}",
+                 lambda f: (f"/event/delete/{f['event'].id}", {}), auth="host"),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every general API endpoint in-process against the current database '
+        '(run seed_data first) and report latency percentiles, queries and peak memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario')
+        parser.add_argument('--cache', choices=['warm', 'cold'], default='warm',
+                            help='cold clears the API cache before every request')
+        parser.add_argument('--scenario', action='append', help='Only run scenarios with this name; repeatable')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--json', action='store_true', help='Print the JSON report instead of a table')
+        parser.add_argument('--compare', help='Earlier JSON report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Relative p50 slowdown that counts as a regression in --compare')
+
+    def handle(self, *args, **options):
+        selected = [s for s in scenarios() if not options['scenario'] or s.name in options['scenario']]
+        if not selected:
+            raise CommandError("No scenario matches --scenario")
+        self.warn_uncovered()
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(ALLOWED_HOSTS=["testserver"], MEDIA_ROOT=media_root,
+                                  PROFILE_DIR=Path(media_root) / "profiles"), \
+                transaction.atomic():
+            # Everything the run writes, fixtures included, is rolled back at the end
+            fixtures = self.fixtures()
+            clients = self.clients(fixtures)
+            results = [self.run(scenario, fixtures, clients, options) for scenario in selected]
+            transaction.set_rollback(True)
+        # Entries cached during the run may hold rows that were just rolled back
+        self.invalidate(fixtures)
+
+        report = {"meta": self.metadata(options), "results": results}
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2) + "\n")
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_table(results)
+        if options['compare']:
+            self.compare(results, json.loads(Path(options['compare']).read_text()), options['threshold'])
+
+    def warn_uncovered(self):
+        covered = {(s.method, s.route) for s in scenarios()}
+        for path, view in router.path_operations.items():
+            for operation in view.operations:
+                for method in operation.methods:
+                    if (method, path) not in covered:
+                        self.stderr.write(f"No benchmark scenario for {method} {path}")
+
+    def fixtures(self):
+        """Representative rows from the seeded data, plus a staff user for this run."""
+        User = get_user_model()
+        event = (
+            Event.objects.filter(approved=True, host__isnull=False)
+            .annotate(n=Count("reviews")).order_by("-n", "id").first()
+        )
+        booking = Booking.objects.select_related("guest").order_by("id").first()
+        tag = EventTags.objects.order_by("id").first()
+        if not (event and booking and tag and Review.objects.exists()):
+            raise CommandError("Not enough data to benchmark; run `manage.py seed_data` first")
+        guest = booking.guest
+        guest.set_password(PASSWORD)
+        guest.save(update_fields=["password"])
+        open_event = (
+            Event.objects.filter(approved=True)
+            .exclude(bookings__guest=guest).filter(number_of_bookings__lt=F("number_of_guests"))
+            .order_by("id").first()
+        )
+        partners = AllowedDM.objects.filter(user1=guest).values("user2").union(
+            AllowedDM.objects.filter(user2=guest).values("user1")
+        )
+        stranger = User.objects.exclude(id=guest.id).exclude(id__in=partners).order_by("id").first()
+        staff = User.objects.create(username=f"bench_staff_{uuid.uuid4().hex[:8]}", is_staff=True)
+        return {
+            "event": event, "host": event.host, "booking": booking, "guest": guest,
+            "open_event": open_event or event, "stranger": stranger or event.host, "staff": staff,
+            "tag": tag.tag_name, "tag_id": tag.id,
+            "profile_id": profiling.save("sample", b"bench 1\n", path="/bench"),
+        }
+
+    def invalidate(self, fixtures):
+        """Orphan every cache entry the scenarios read, in this process and the shared cache.
+
+        Bumps the namespace versions rather than clearing the cache: the
+        shared backend also holds sessions and a live server's entries.
+        """
+        users = [fixtures[role] for role in ("guest", "host", "stranger", "staff")]
+        api_cache.bump("events", "tags", "users", *(f"dms:{user.id}" for user in users))
+        api_cache.local.clear()
+        feed.reset()
+
+    def clients(self, fixtures):
+        clients = {}
+        for role in ("guest", "host", "staff"):
+            clients[role] = Client()
+            clients[role].force_login(fixtures[role])
+        return clients
+
+    def prepare(self, scenario, fixtures, clients):
+        """Everything but the request itself, so setup stays out of the timings."""
+        path, kwargs = scenario.request(fixtures)
+        if scenario.auth is None:
+            # No cookies carried over: a session created by one request is
+            # rolled back with its savepoint and would break the next one
+            client = Client()
+        elif scenario.name == "logout":
+            # Logging out ends the session, so every request needs a fresh one
+            client = Client()
+            client.force_login(fixtures["guest"])
+        else:
+            client = clients[scenario.auth]
+        method = getattr(client, scenario.method.lower())
+        return lambda: method(PREFIX + path, **kwargs)
+
+    def run(self, scenario, fixtures, clients, options):
+        def once():
+            if options['cache'] == 'cold':
+                self.invalidate(fixtures)
+            # Each request runs in its own savepoint, so writes never pile up
+            with transaction.atomic():
+                request = self.prepare(scenario, fixtures, clients)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - start
+                if getattr(response, "streaming", False):
+                    b"".join(response.streaming_content)
+                transaction.set_rollback(True)
+            return response.status_code, elapsed, len(queries)
+
+        for _ in range(options['warmup']):
+            once()
+
+        latencies, query_counts, statuses = [], [], set()
+        for _ in range(options['iterations']):
+            status, elapsed, queries = once()
+            latencies.append(elapsed * 1000)
+            query_counts.append(queries)
+            statuses.add(status)
+
+        # A separate pass: tracemalloc slows everything down, so it stays out of the timings
+        tracemalloc.start()
+        try:
+            once()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "scenario": scenario.name,
+            "method": scenario.method,
+            "route": scenario.route,
+            "status": sorted(statuses),
+            "iterations": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            "queries": max(query_counts, default=0),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def metadata(self, options):
+        try:
+            revision = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            revision = None
+        return {
+            "revision": revision,
+            "timestamp": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "cache": options['cache'],
+            "iterations": options['iterations'],
+            "warmup": options['warmup'],
+            "rows": self.row_counts(),
+        }
+
+    def row_counts(self):
+        return {
+            "users": get_user_model().objects.count(),
+            "events": Event.objects.count(),
+            "bookings": Booking.objects.count(),
+            "reviews": Review.objects.count(),
+            "allowed_dms": AllowedDM.objects.count(),
+        }
+
+    def print_table(self, results):
+        self.stdout.write(
+            f"{'scenario':<18} {'status':<9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KB':>9}"
+        )
+        for r in results:
+            status = ",".join(str(s) for s in r["status"])
+            self.stdout.write(
+                f"{r['scenario']:<18} {status:<9} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                f"{r['queries']:>8} {r['peak_kb']:>9.1f}"
+            )
+
+    def compare(self, results, baseline, threshold):
+        """Print the change per scenario; fail on slower p50s or extra queries."""
+        before = {r["scenario"]: r for r in baseline["results"]}
+        rows = baseline.get("meta", {}).get("rows")
+        if rows and rows != self.row_counts():
+            self.stderr.write("Row counts differ from the baseline; timings are not directly comparable")
+
+        regressions = []
+        self.stdout.write(f"\nAgainst {baseline.get('meta', {}).get('revision') or 'baseline'}:")
+        for r in results:
+            old = before.get(r["scenario"])
+            if old is None:
+                continue
+            ratio = r["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 1.0
+            line = (
+                f"{r['scenario']:<18} p50 {old['p50_ms']:>8.2f} -> {r['p50_ms']:>8.2f} ms ({ratio - 1:+.0%})  "
+                f"queries {old['queries']} -> {r['queries']}"
+            )
+            slower = ratio > 1 + threshold and r["p50_ms"] - old["p50_ms"] > NOISE_FLOOR_MS
+            if slower or r["queries"] > old["queries"]:
+                regressions.append(r["scenario"])
+                line += "  REGRESSION"
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"Regressions in: {', '.join(regressions)}")
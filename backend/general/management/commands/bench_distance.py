@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from general.geo import haversine_miles
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorized haversine engine against the per-row geopy loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated event counts to benchmark')
+        parser.add_argument('--radius', type=float, default=50.0,
+                            help='Search radius in miles')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+        origin = (39.7392, -104.9903)  # Denver
+
+        self.stdout.write(f"{'events':>8} {'geopy (s)':>11} {'numpy (s)':>11} {'speedup':>9} {'matches':>8}")
+        for size in [int(n) for n in options['sizes'].split(',')]:
+            lats = [rng.uniform(37.0, 41.0) for _ in range(size)]
+            lons = [rng.uniform(-109.0, -102.0) for _ in range(size)]
+
+            start = time.perf_counter()
+            geopy_matches = sum(
+                1 for lat, lon in zip(lats, lons)
+                if geodesic(origin, (lat, lon)).miles <= radius
+            )
+            geopy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            distances = haversine_miles(origin[0], origin[1], lats, lons)
+            numpy_matches = int((distances <= radius).sum())
+            numpy_time = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{size:>8} {geopy_time:>11.4f} {numpy_time:>11.4f} "
+                f"{geopy_time / numpy_time:>8.0f}x {numpy_matches:>8}"
+            )
+            if geopy_matches != numpy_matches:
+                self.stdout.write(
+                    f"         geopy matched {geopy_matches}; difference is events on the radius edge"
+                )
@@ -0,0 +1,55 @@
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+
+
+class Command(BaseCommand):
+    help = 'Database round trips and latency per authenticated API request for each session engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--path', default='/api/general/user')
+        parser.add_argument('--engine', action='append', choices=list(ENGINES),
+                            help='Engine to measure; repeat to compare (default: all)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.create_user(username=f"bench_sessions_{uuid.uuid4().hex[:8]}")
+        try:
+            self.stdout.write(f"{options['requests']} x GET {options['path']}")
+            self.stdout.write(f"{'engine':<16} {'queries/req':>12} {'session/req':>12} {'ms/req':>8}")
+            for name in options['engine'] or list(ENGINES):
+                queries, session_queries, ms = self.measure(ENGINES[name], user, options)
+                self.stdout.write(f"{name:<16} {queries:>12.2f} {session_queries:>12.2f} {ms:>8.2f}")
+        finally:
+            user.delete()
+
+    def measure(self, engine, user, options):
+        with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=["testserver"]):
+            client = Client()
+            client.force_login(user)
+            client.get(options['path'])  # warm the session cache / connection
+
+            total = options['requests']
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                for _ in range(total):
+                    response = client.get(options['path'])
+                    assert response.status_code == 200, response.status_code
+                elapsed = time.perf_counter() - start
+            client.logout()
+
+        tables = Counter("django_session" in query["sql"] for query in captured)
+        return len(captured) / total, tables[True] / total, elapsed / total * 1000
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.core.management.base import BaseCommand, CommandError
+
+from general.mail import PooledMailer
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class SlowHandshakeHandler:
+    """aiosmtpd handler that delays EHLO to stand in for STARTTLS + AUTH round trips."""
+
+    def __init__(self, handshake_delay):
+        self.handshake_delay = handshake_delay
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 Message accepted for delivery'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-message send_mail against the pooled, batched mailer (needs `pip install aiosmtpd`)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--handshake-ms', type=float, default=30.0,
+                            help='Simulated connection setup latency of the relay')
+        parser.add_argument('--port', type=int, default=8025)
+
+    def handle(self, *args, **options):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            raise CommandError("bench_smtp needs the aiosmtpd package: pip install aiosmtpd")
+
+        handler = SlowHandshakeHandler(options['handshake_ms'] / 1000)
+        controller = Controller(handler, hostname='127.0.0.1', port=options['port'])
+        controller.start()
+        try:
+            def connect():
+                return get_connection(
+                    backend=SMTP_BACKEND, host='127.0.0.1', port=options['port'],
+                    username='', password='', use_tls=False, fail_silently=False,
+                )
+
+            count = options['messages']
+            messages = [
+                EmailMessage(f"Event update {i}", "Your event changed.", "no-reply@example.com",
+                             [f"guest{i}@example.com"])
+                for i in range(count)
+            ]
+
+            start = time.perf_counter()
+            for message in messages:
+                send_mail(message.subject, message.body, message.from_email, message.to, connection=connect())
+            per_message = time.perf_counter() - start
+
+            mailer = PooledMailer(batch_size=options['batch_size'], record=False, connection_factory=connect)
+            start = time.perf_counter()
+            outcomes = mailer.send(messages)
+            mailer.close()
+            pooled = time.perf_counter() - start
+        finally:
+            controller.stop()
+
+        failed = sum(1 for error in outcomes if error)
+        self.stdout.write(f"{count} messages, {options['handshake_ms']:.0f}ms simulated handshake")
+        self.stdout.write(f"  send_mail per message: {per_message:.2f}s ({count / per_message:.0f} msg/s)")
+        self.stdout.write(f"  pooled batches of {options['batch_size']}: {pooled:.2f}s ({count / pooled:.0f} msg/s)")
+        self.stdout.write(f"  speedup {per_message / pooled:.1f}x, failed {failed}, server received {handler.received}")
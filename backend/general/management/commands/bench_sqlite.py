@@ -0,0 +1,103 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Django's stock sqlite3 setup: rollback journal, full fsync, 5s driver timeout
+STOCK_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = 'Mixed read/write SQLite throughput: stock settings vs the tuned profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+        parser.add_argument('--rows', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        if not settings.SQLITE_PRAGMAS:
+            raise CommandError("SQLITE_PRAGMAS is empty; run with DJANGO_DB_PROFILE=sqlite")
+        profiles = [
+            # name, pragmas, reuse connections (CONN_MAX_AGE)
+            ("stock", STOCK_PRAGMAS, False),
+            ("tuned", settings.SQLITE_PRAGMAS, True),
+        ]
+        self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, {options['duration']}s each")
+        self.stdout.write(f"{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+        for name, pragmas, reuse in profiles:
+            reads, writes, errors = self.run_profile(pragmas, reuse, options)
+            duration = options['duration']
+            self.stdout.write(f"{name:<8} {reads / duration:>10.0f} {writes / duration:>10.0f} {errors:>8}")
+
+    def run_profile(self, pragmas, reuse, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+
+            def connect():
+                conn = sqlite3.connect(path, timeout=5)
+                for key, value in pragmas.items():
+                    conn.execute(f"PRAGMA {key} = {value}")
+                return conn
+
+            setup = connect()
+            setup.execute(
+                "CREATE TABLE event (id INTEGER PRIMARY KEY, approved INTEGER, "
+                "occurence_date REAL, number_of_bookings INTEGER, title TEXT)"
+            )
+            setup.executemany(
+                "INSERT INTO event (approved, occurence_date, number_of_bookings, title) VALUES (?, ?, 0, ?)",
+                [(1, random.random() * 1e6, f"Event {i}") for i in range(options['rows'])],
+            )
+            setup.execute("CREATE INDEX event_date ON event (approved, occurence_date)")
+            setup.commit()
+            setup.close()
+
+            counts = {"reads": 0, "writes": 0, "errors": 0}
+            lock = threading.Lock()
+            deadline = time.monotonic() + options['duration']
+
+            def worker(kind):
+                local = {"ok": 0, "errors": 0}
+                conn = connect() if reuse else None
+                while time.monotonic() < deadline:
+                    # Without reuse every "request" opens its own connection
+                    c = conn or connect()
+                    try:
+                        if kind == "reads":
+                            start = random.random() * 1e6
+                            c.execute(
+                                "SELECT id, title FROM event WHERE approved = 1 AND occurence_date >= ? "
+                                "ORDER BY occurence_date LIMIT 50", (start,)
+                            ).fetchall()
+                        else:
+                            c.execute(
+                                "UPDATE event SET number_of_bookings = number_of_bookings + 1 WHERE id = ?",
+                                (random.randint(1, options['rows']),),
+                            )
+                            c.commit()
+                        local["ok"] += 1
+                    except sqlite3.OperationalError:
+                        local["errors"] += 1
+                    finally:
+                        if not reuse:
+                            c.close()
+                if conn:
+                    conn.close()
+                with lock:
+                    counts[kind] += local["ok"]
+                    counts["errors"] += local["errors"]
+
+            threads = [threading.Thread(target=worker, args=("reads",)) for _ in range(options['readers'])]
+            threads += [threading.Thread(target=worker, args=("writes",)) for _ in range(options['writers'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return counts["reads"], counts["writes"], counts["errors"]
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from general import images
+from general.jobs import enqueue
+from general.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Backfill resized WebP/AVIF derivatives for existing event photos and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist')
+        parser.add_argument('--queue', action='store_true',
+                            help='Enqueue image_derivatives jobs for the worker instead of building inline')
+
+    def handle(self, *args, **options):
+        force, queue = options['force'], options['queue']
+        counts = {"event": 0, "user": 0}
+
+        events = Event.objects.exclude(photos=None).only("id", "photos", "photo_variants")
+        users = get_user_model().objects.exclude(profile_pic="").exclude(profile_pic=None).only(
+            "id", "profile_pic", "profile_pic_variants"
+        )
+        for model, rows, refresh in (("event", events, images.refresh_event), ("user", users, images.refresh_user)):
+            for row in rows.iterator():
+                if model == "event":
+                    todo = images.pending(row.photos or [], {} if force else row.photo_variants)
+                else:
+                    todo = images.pending([row.profile_pic.url], {} if force else row.profile_pic_variants)
+                if not todo:
+                    continue
+                if queue:
+                    enqueue("image_derivatives", model=model, id=row.id, force=force)
+                else:
+                    refresh(row, force=force)
+                counts[model] += 1
+
+        action = "Queued" if queue else "Processed"
+        self.stdout.write(f"{action} {counts['event']} events and {counts['user']} profile pictures")
@@ -0,0 +1,91 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    "/api/general/event/get_all",
+    "/api/general/tags",
+    "/api/general/event/id/1",
+    "/api/general/health",
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'HTTP load test of running deployments at increasing concurrency, e.g. '
+        '--target wsgi=http://localhost:5000 --target asgi=http://localhost:5001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=base_url of a running deployment; repeat to compare')
+        parser.add_argument('--path', action='append', help='Request path; repeat for a mix (default: hot reads)')
+        parser.add_argument('--concurrency', default='1,8,32,64', help='Comma separated client concurrency levels')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per concurrency level')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f"--target must be name=url, got {target!r}")
+            targets.append((name, url.rstrip('/')))
+        paths = options['path'] or DEFAULT_PATHS
+        levels = [int(n) for n in options['concurrency'].split(',')]
+
+        results = []
+        for name, base_url in targets:
+            for concurrency in levels:
+                result = self.run_level(base_url, paths, concurrency, options['requests'], options['timeout'])
+                result.update({"target": name, "concurrency": concurrency})
+                results.append(result)
+                if not options['json']:
+                    self.stdout.write(
+                        f"{name:<8} c={concurrency:<4} {result['rps']:>8.1f} req/s  "
+                        f"p50={result['p50_ms']:>7.1f}ms  p99={result['p99_ms']:>7.1f}ms  "
+                        f"errors={result['errors']}"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def run_level(self, base_url, paths, concurrency, total, timeout):
+        def fetch(i):
+            url = base_url + paths[i % len(paths)]
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                    ok = response.status < 500
+            except urllib.error.HTTPError as e:
+                ok = e.code < 500
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        return {
+            "requests": total,
+            "errors": sum(1 for _, ok in samples if not ok),
+            "rps": round(total / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
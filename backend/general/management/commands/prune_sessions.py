@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired database sessions in small batches. Unlike clearsessions, '
+        'no single DELETE holds the SQLite write lock for long'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches so other writers get the lock')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE.endswith("signed_cookies"):
+            self.stdout.write("Sessions live in signed cookies; nothing to prune")
+            return
+
+        now = timezone.now()
+        deleted = batches = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list("session_key", flat=True)[: options['batch_size']]
+            )
+            if not keys:
+                break
+            count, _ = Session.objects.filter(session_key__in=keys).delete()
+            deleted += count
+            batches += 1
+            time.sleep(options['pause'])
+        self.stdout.write(f"Deleted {deleted} expired sessions in {batches} batches")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from general.cache import api_cache
+from general.models import Event, FeedChange
+from general.reviews import rebuild_review_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-event review aggregates (count, rating sum, per-star counts) from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', help='Only this event id; repeatable')
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options['event']:
+            events = events.filter(id__in=options['event'])
+        updated = rebuild_review_stats(events)
+        FeedChange.record(*(options['event'] or []))
+        api_cache.bump("events")
+        self.stdout.write(f"Rebuilt review stats for {updated} events")
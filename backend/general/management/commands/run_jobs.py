@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from general.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs (emails and other slow side effects)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain due jobs and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_pending(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s)")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,148 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from general.cache import api_cache
+from general.models import AllowedDM, Booking, Event, EventTags, FeedChange, Review
+from general.reviews import rebuild_review_stats
+
+PREFIX = "seed_"
+PASSWORD = "seed-password"
+BATCH_SIZE = 2000
+
+CITIES = [
+    ("Denver, CO", 39.7392, -104.9903),
+    ("Boulder, CO", 40.0150, -105.2705),
+    ("Austin, TX", 30.2672, -97.7431),
+    ("Portland, OR", 45.5152, -122.6784),
+    ("Chicago, IL", 41.8781, -87.6298),
+    ("New York, NY", 40.7128, -74.0060),
+]
+ADJECTIVES = ["Sunset", "Hidden", "Local", "Backyard", "Rooftop", "Late night", "Family", "Vintage"]
+ACTIVITIES = ["jazz session", "pottery class", "salsa night", "comedy hour", "hike", "supper club",
+              "vinyl listening", "improv show", "bike tour", "tasting"]
+WORDS = ("bring friends cozy outdoor music food drinks history art craft learn meet neighbors "
+         "beginner friendly hands on small group guided walk stories local market").split()
+REVIEW_TEXTS = ["Loved it", "Great host", "Would come again", "A bit crowded", "Not for me", "Hidden gem"]
+
+
+class Command(BaseCommand):
+    help = 'Seed reproducible synthetic users, events, bookings, reviews and DM pairs (for benchmarks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--bookings-per-event', type=int, default=5, help='Average bookings per event')
+        parser.add_argument('--reviews-per-event', type=int, default=3, help='Average reviews per event')
+        parser.add_argument('--dms-per-user', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help=f'Delete earlier {PREFIX}* data first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        User = get_user_model()
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} rows of earlier seed data")
+        elif User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f"{PREFIX}* users already exist; pass --clear to replace them")
+
+        call_command('seed_tags', stdout=io.StringIO())
+        tags = list(EventTags.objects.order_by("id"))
+
+        with transaction.atomic():
+            # One hash for everyone: hashing per user would dominate the run
+            password = make_password(PASSWORD)
+            users = User.objects.bulk_create([
+                User(
+                    username=f"{PREFIX}{i}", email=f"{PREFIX}{i}@example.com", password=password,
+                    first_name=f"Seed{i}", last_name="User",
+                    is_host=i % 5 == 0, is_traveler=i % 5 != 0,
+                )
+                for i in range(options['users'])
+            ], batch_size=BATCH_SIZE)
+            hosts = [user for user in users if user.is_host] or users
+
+            events, bookings = self.build_events(rng, options, hosts, users)
+            events = Event.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+            Through = Event.tags.through
+            Through.objects.bulk_create([
+                Through(event_id=event.id, eventtags_id=tag.id)
+                for event in events
+                for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+            ], batch_size=BATCH_SIZE)
+
+            Booking.objects.bulk_create([
+                Booking(event_id=events[index].id, guest_id=guest.id)
+                for index, guests in bookings.items()
+                for guest in guests
+            ], batch_size=BATCH_SIZE)
+
+            now = timezone.now()
+            Review.objects.bulk_create([
+                Review(
+                    event_id=event.id, text=rng.choice(REVIEW_TEXTS),
+                    rating=rng.choices(range(1, 6), weights=(1, 1, 3, 6, 9))[0],
+                    created_at=now - timedelta(days=rng.randint(0, 365)),
+                )
+                for event in events
+                for _ in range(rng.randint(0, 2 * options['reviews_per_event']))
+            ], batch_size=BATCH_SIZE)
+            # bulk_create skips the signals that maintain the aggregates
+            rebuild_review_stats(Event.objects.filter(host__username__startswith=PREFIX))
+
+            pairs = set()
+            for user in users:
+                for partner in rng.sample(users, min(options['dms_per_user'], len(users))):
+                    if partner.id != user.id:
+                        pairs.add((min(user.id, partner.id), max(user.id, partner.id)))
+            AllowedDM.objects.bulk_create(
+                [AllowedDM(user1_id=a, user2_id=b) for a, b in sorted(pairs)],
+                batch_size=BATCH_SIZE, ignore_conflicts=True,
+            )
+
+        # bulk_create sends no signals, so nothing logged which feed rows changed
+        FeedChange.record()
+        api_cache.bump("events", "tags", "users")
+        self.stdout.write(
+            f"Seeded {len(users)} users, {len(events)} events, "
+            f"{sum(len(g) for g in bookings.values())} bookings, {Review.objects.filter(event__in=events).count()} "
+            f"reviews and {len(pairs)} DM pairs in {time.perf_counter() - started:.1f}s "
+            f"(log in as {PREFIX}0 / {PASSWORD})"
+        )
+
+    def build_events(self, rng, options, hosts, users):
+        """Events plus, per event index, the guests who booked it (never over capacity)."""
+        now = timezone.now()
+        events, bookings = [], {}
+        for i in range(options['events']):
+            city, lat, lon = rng.choice(CITIES)
+            capacity = rng.randint(4, 40)
+            guests = rng.sample(users, min(capacity, rng.randint(0, 2 * options['bookings_per_event']), len(users)))
+            bookings[i] = guests
+            events.append(Event(
+                title=f"{rng.choice(ADJECTIVES)} {rng.choice(ACTIVITIES)}",
+                description=" ".join(rng.choices(WORDS, k=rng.randint(12, 40))),
+                unique_aspect=" ".join(rng.choices(WORDS, k=8)),
+                host=rng.choice(hosts),
+                occurence_date=now + timedelta(hours=rng.randint(-24 * 60, 24 * 120)),
+                location=city,
+                latitude=lat + rng.uniform(-0.5, 0.5),
+                longitude=lon + rng.uniform(-0.5, 0.5),
+                price=rng.choice([0, 10, 15, 25, 40, 60]),
+                number_of_guests=capacity,
+                number_of_bookings=len(guests),
+                approved=rng.random() < 0.9,
+            ))
+        return events, bookings
@@ -0,0 +1,82 @@
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from ninja.errors import HttpError
+
+from general.api import register_booking
+from general.models import Booking, Event
+
+
+class Command(BaseCommand):
+    help = 'Fire parallel bookings at one event and verify the counter and capacity hold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=200, help='Number of distinct guests booking')
+        parser.add_argument('--capacity', type=int, default=50, help='number_of_guests of the event')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated event and users')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        User.objects.bulk_create([
+            User(username=f"stress_{run_id}_{i}", email=f"stress_{run_id}_{i}@example.com")
+            for i in range(options['guests'])
+        ])
+        users = list(User.objects.filter(username__startswith=f"stress_{run_id}_"))
+        event = Event.objects.create(
+            title=f"Booking stress {run_id}", location="Nowhere",
+            number_of_guests=options['capacity'], approved=False,
+        )
+        factory = RequestFactory()
+
+        def book(user):
+            request = factory.post(f"/api/general/booking/register/{event.id}")
+            request.user = user
+            try:
+                result = register_booking(request, event.id)
+                return result["message"]
+            except HttpError as e:
+                return f"HTTP {e.status_code}"
+            except Exception as e:
+                return f"error: {e.__class__.__name__}: {e}"
+            finally:
+                connection.close()
+
+        # Every guest books twice so duplicate requests race as well
+        attempts = users + users
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            outcomes = Counter(pool.map(book, attempts))
+        elapsed = time.perf_counter() - start
+
+        event.refresh_from_db()
+        booked = Booking.objects.filter(event=event).count()
+
+        self.stdout.write(f"{len(attempts)} requests in {elapsed:.2f}s ({len(attempts) / elapsed:.0f} req/s)")
+        for outcome, count in outcomes.most_common():
+            self.stdout.write(f"  {count:>6}  {outcome}")
+        self.stdout.write(
+            f"capacity={event.number_of_guests} bookings rows={booked} "
+            f"number_of_bookings={event.number_of_bookings}"
+        )
+
+        ok = (
+            event.number_of_bookings == booked
+            and booked <= event.number_of_guests
+            and booked == outcomes["Booking created successfully"]
+        )
+
+        if not options['keep']:
+            event.delete()
+            User.objects.filter(username__startswith=f"stress_{run_id}_").delete()
+
+        if not ok:
+            raise CommandError("Booking counter drifted or capacity was exceeded")
+        self.stdout.write(self.style.SUCCESS("Counter exact and capacity respected"))
@@ -0,0 +1,94 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Upper bounds of the histogram buckets (+Inf is implicit)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-on-export histogram in the Prometheus bucket model."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def exposition(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_time = Histogram(DURATION_BUCKETS)
+        self.db_queries = Histogram(QUERY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.statuses = defaultdict(int)
+
+
+class Registry:
+    """Per-process request metrics, keyed on (endpoint, method).
+
+    Each gunicorn worker keeps its own numbers; Prometheus sums them when
+    every worker is scraped, or a scrape sees one worker's share.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointMetrics)
+
+    def record(self, endpoint, method, status, duration, db_time, db_queries, size):
+        with self._lock:
+            metrics = self.endpoints[(endpoint, method)]
+            metrics.duration.observe(duration)
+            metrics.db_time.observe(db_time)
+            metrics.db_queries.observe(db_queries)
+            if size is not None:
+                metrics.response_size.observe(size)
+            metrics.statuses[status] += 1
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def exposition(self, extra=()):
+        """Prometheus text format (version 0.0.4)."""
+        families = {
+            "api_request_duration_seconds": ("histogram", "Wall time per request", "duration"),
+            "api_db_duration_seconds": ("histogram", "Time spent in SQL per request", "db_time"),
+            "api_db_queries": ("histogram", "SQL queries per request", "db_queries"),
+            "api_response_size_bytes": ("histogram", "Response body size", "response_size"),
+        }
+        with self._lock:
+            snapshot = sorted(self.endpoints.items())
+            lines = []
+            for name, (kind, help_text, attr) in families.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for (endpoint, method), metrics in snapshot:
+                    lines += getattr(metrics, attr).exposition(name, f'endpoint="{endpoint}",method="{method}"')
+            lines += ["# HELP api_requests_total Requests by response status", "# TYPE api_requests_total counter"]
+            for (endpoint, method), metrics in snapshot:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'api_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}'
+                    )
+        for name, kind, help_text, value in extra:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,92 @@
+import time
+
+from django.contrib.messages.middleware import MessageMiddleware as DjangoMessageMiddleware
+from django.db import connection
+
+from . import profiling
+from .metrics import registry
+
+API_PREFIX = "/api/"
+
+
+class MessageMiddleware(DjangoMessageMiddleware):
+    """The messages framework minus /api/ requests.
+
+    JSON endpoints never render messages, but the stock middleware still
+    sets up cookie + session storage for them, and reading pending messages
+    loads the session. Django's process_response already skips requests
+    without storage.
+    """
+
+    def process_request(self, request):
+        if not request.path.startswith(API_PREFIX):
+            super().process_request(request)
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and sums their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record latency, SQL count/time, size and status of every /api/ request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(API_PREFIX):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        # Ninja names each route after its view function, e.g. list_filtered_events
+        endpoint = (match.url_name or match.route) if match else "unmatched"
+        size = None if response.streaming else len(response.content)
+        registry.record(endpoint, request.method, response.status_code, duration, timer.elapsed, timer.count, size)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile single requests from staff who ask for it (see general/profiling.py).
+
+    Everyone else pays for one header lookup. Must come after
+    AuthenticationMiddleware; the profile covers the middleware below this
+    one and the view, and of a streaming response only the part produced
+    before the body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        response, data = profiling.profile(mode, lambda: self.get_response(request))
+        profile_id = profiling.save(
+            mode, data,
+            method=request.method, path=request.get_full_path(), status=response.status_code,
+            duration_ms=round((time.perf_counter() - start) * 1000, 2),
+            user=request.user.username, created=time.time(), streaming=response.streaming,
+        )
+        response["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# Only applied on the postgis profile; SQLite keeps using latitude/longitude.
+FORWARD_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    "ALTER TABLE general_event ADD COLUMN IF NOT EXISTS point geography(Point, 4326)",
+    # Data migration: fill the column for existing events
+    """
+    UPDATE general_event
+    SET point = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """,
+    "CREATE INDEX IF NOT EXISTS event_point_gist ON general_event USING GIST (point)",
+    """
+    CREATE OR REPLACE FUNCTION general_event_sync_point() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.latitude IS NULL OR NEW.longitude IS NULL THEN
+            NEW.point := NULL;
+        ELSE
+            NEW.point := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326)::geography;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS general_event_sync_point ON general_event",
+    """
+    CREATE TRIGGER general_event_sync_point
+    BEFORE INSERT OR UPDATE OF latitude, longitude ON general_event
+    FOR EACH ROW EXECUTE FUNCTION general_event_sync_point()
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS general_event_sync_point ON general_event",
+    "DROP FUNCTION IF EXISTS general_event_sync_point()",
+    "DROP INDEX IF EXISTS event_point_gist",
+    "ALTER TABLE general_event DROP COLUMN IF EXISTS point",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general', '0008_event_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(FORWARD_SQL), run_on_postgres(REVERSE_SQL)),
+    ]
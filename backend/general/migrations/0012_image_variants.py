@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general', '0011_emaildelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_pic_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# Spelled out here rather than imported from general.search, so later edits
+# to the app code can't change what this migration does
+FTS_TABLE = "general_event_fts"
+
+TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, unique_aspect, location, tags,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+TRIGGERS = (
+    "general_event_fts_insert",
+    "general_event_fts_update",
+    "general_event_fts_delete",
+    "general_event_fts_tag_added",
+    "general_event_fts_tag_removed",
+    "general_event_fts_tag_renamed",
+)
+
+
+# Only applied on SQLite; other databases search with icontains instead.
+# The sync triggers and the initial fill are added by the post_migrate hook
+# (general/signals.py), after every other migration in the run.
+def forward(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(TABLE_SQL)
+
+
+def reverse(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for name in TRIGGERS:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0 on 2026-10-18 17:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+# Data migration: aggregate the reviews that already exist. Kept separate
+# from general.reviews.review_stats_expressions so later edits there can't
+# change what this migration does.
+def backfill(apps, schema_editor):
+    Event = apps.get_model('general', 'Event')
+    Review = apps.get_model('general', 'Review')
+
+    def aggregate(expression, **filters):
+        rows = (
+            Review.objects.filter(event=OuterRef("pk"), **filters)
+            .order_by().values("event").annotate(value=expression).values("value")
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    stats = {
+        "review_count": aggregate(Count("id")),
+        "rating_sum": aggregate(Sum("rating")),
+    }
+    for rating in range(1, 6):
+        stats[f"ratings_{rating}"] = aggregate(Count("id"), rating=rating)
+    Event.objects.update(**stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general', '0013_event_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ratings_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ratings_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ratings_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ratings_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ratings_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general', '0014_event_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['occurence_date', 'id'], name='event_approved_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('approved', True), ('number_of_bookings__lt', models.F('number_of_guests'))), fields=['occurence_date', 'id'], name='event_available_date_idx'),
+        ),
+    ]
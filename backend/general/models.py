@@ -33,10 +33,40 @@ class Event(models.Model):
     location = models.CharField(max_length=255)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
-    #point = geomodels.PointField(geography=True, blank=True, null=True)
+    # On the postgis profile a geography(Point) `point` column is kept in sync
+    # with latitude/longitude by a trigger (migration 0009); it is not an ORM
+    # field so the SQLite default keeps working without spatial libraries.
 
     price = models.DecimalField(default=0.00, max_digits=10, decimal_places=2, blank=True, null=True)
     photos = models.JSONField(blank=True, null=True)
+    # photo URL -> {"thumb.webp": url, ...}, filled in by general/images.py
+    photo_variants = models.JSONField(default=dict, blank=True)
+
+    # Review aggregates, maintained incrementally (general/reviews.py)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    ratings_1 = models.PositiveIntegerField(default=0)
+    ratings_2 = models.PositiveIntegerField(default=0)
+    ratings_3 = models.PositiveIntegerField(default=0)
+    ratings_4 = models.PositiveIntegerField(default=0)
+    ratings_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Bounding-box prefilter for radius searches (see general/geo.py)
+            models.Index(fields=["latitude", "longitude"], name="event_lat_lon_idx"),
+            # Public listing: approved only, date range + (occurence_date, id) keyset order
+            models.Index(
+                fields=["occurence_date", "id"], condition=models.Q(approved=True),
+                name="event_approved_date_idx",
+            ),
+            # available_only listing; rows leave the index once the event fills up
+            models.Index(
+                fields=["occurence_date", "id"],
+                condition=models.Q(approved=True, number_of_bookings__lt=models.F("number_of_guests")),
+                name="event_available_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -75,6 +105,7 @@ def user_profile_pic_path(instance, filename):
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_pic = models.ImageField(upload_to=user_profile_pic_path, blank=True, null=True)
+    profile_pic_variants = models.JSONField(default=dict, blank=True)
     is_traveler = models.BooleanField(default=False)
     is_host = models.BooleanField(default=False)
 
@@ -98,3 +129,65 @@ class AllowedDM(models.Model):
     def __str__(self):
         return f"DM: {self.user1.username} ⇄ {self.user2.username}"
 
+
+
+class Job(models.Model):
+    """A unit of deferred work (emails and other slow side effects), see general/jobs.py."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(s, s) for s in (PENDING, RUNNING, DONE, FAILED)]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class EmailDelivery(models.Model):
+    """Outcome of one outgoing email, recorded by general.mail.PooledMailer."""
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [(SENT, SENT), (FAILED, FAILED)]
+
+    to = models.CharField(max_length=500)
+    subject = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"{self.subject} → {self.to} ({self.status})"
+
+
+class FeedChange(models.Model):
+    """An event whose row in the feed snapshot may be stale, see general/feed.py.
+
+    A NULL event_id means any row may be (a tag rename, bulk writes).
+    """
+    # Not a foreign key: deleted events are logged too
+    event_id = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(default=now)
+
+    @classmethod
+    def record(cls, *event_ids):
+        """Log changed events; without ids, everything changed."""
+        cls.objects.bulk_create([cls(event_id=event_id) for event_id in event_ids] or [cls()])
+
+    def __str__(self):
+        return f"Feed change #{self.id}: event {self.event_id or 'all'}"
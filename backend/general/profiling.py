@@ -0,0 +1,138 @@
+import cProfile
+import json
+import marshal
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+# Staff opt in per request with the header (X-Profile: cprofile|sample) or ?_profile=...
+# The query flag is also part of the API cache key, so it profiles a cache miss;
+# use the header to profile whatever a normal request would hit.
+HEADER = "X-Profile"
+QUERY_FLAG = "_profile"
+MODES = ("cprofile", "sample")
+
+# Interval of the sampling profiler, and how deep a stack it keeps
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 128
+
+PROFILE_ID = re.compile(r"^[0-9]{19}-[0-9a-f]{8}$")
+EXTENSIONS = {"cprofile": "prof", "sample": "folded"}
+
+
+def requested_mode(request):
+    """The profiler a request asks for, or None. Cheap enough to run on every request."""
+    flag = request.headers.get(HEADER)
+    if not flag and QUERY_FLAG in request.META.get("QUERY_STRING", ""):
+        flag = request.GET.get(QUERY_FLAG)
+    if not flag:
+        return None
+    flag = flag.lower()
+    return flag if flag in MODES else MODES[0]
+
+
+class Sampler:
+    """Records the stack of one thread every SAMPLE_INTERVAL from a helper thread.
+
+    Counts are kept in collapsed-stack form ("outer;inner;leaf count"),
+    which flamegraph.pl, speedscope and inferno read directly. Only the
+    request's own thread is sampled, so the event loop of an async view
+    shows up as the async_to_sync wait, with its ORM calls on this thread.
+    """
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile(mode, call):
+    """Run call() under the profiler; returns (result, profile bytes)."""
+    if mode == "sample":
+        with Sampler(threading.get_ident()) as sampler:
+            result = call()
+        return result, sampler.collapsed().encode()
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(call)
+    profiler.create_stats()
+    # What Profile.dump_stats() writes: loads with pstats, snakeviz, flameprof
+    return result, marshal.dumps(profiler.stats)
+
+
+### On-disk ring buffer: <id>.json metadata next to <id>.prof / <id>.folded
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def save(mode, data, **meta):
+    """Store one profile, then drop the oldest beyond settings.PROFILE_KEEP. Returns its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Nanosecond timestamp first, so ids sort oldest to newest
+    profile_id = f"{time.time_ns():019d}-{uuid.uuid4().hex[:8]}"
+    filename = f"{profile_id}.{EXTENSIONS[mode]}"
+    (directory / filename).write_bytes(data)
+    meta.update(id=profile_id, mode=mode, file=filename, size=len(data))
+    # Metadata last: a profile is only listed once its data is on disk
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta))
+    prune(settings.PROFILE_KEEP)
+    return profile_id
+
+
+def prune(keep):
+    entries = sorted(profile_dir().glob("*.json"))
+    for stale in entries[: max(0, len(entries) - keep)]:
+        for path in profile_dir().glob(f"{stale.stem}.*"):
+            path.unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # pruned or half-written by another worker
+    return profiles
+
+
+def profile_path(profile_id):
+    """Path of a stored profile's data, or None for unknown or malformed ids."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    for extension in EXTENSIONS.values():
+        path = profile_dir() / f"{profile_id}.{extension}"
+        if path.exists():
+            return path
+    return None
@@ -0,0 +1,97 @@
+import base64
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from ninja.errors import HttpError
+
+from .models import Event, Review
+
+STARS = range(1, 6)
+REVIEW_PAGE_SIZE = 50
+MAX_REVIEW_PAGE_SIZE = 200
+
+
+def star_field(rating):
+    return f"ratings_{rating}"
+
+
+### Incremental aggregates on Event
+def record_review(event_id, rating, delta=1):
+    """Add (delta=1) or remove (delta=-1) one rating from an event's aggregates.
+
+    A single UPDATE with F() expressions, so concurrent reviews never lose
+    increments.
+    """
+    Event.objects.filter(id=event_id).update(**{
+        "review_count": F("review_count") + delta,
+        "rating_sum": F("rating_sum") + delta * rating,
+        star_field(rating): F(star_field(rating)) + delta,
+    })
+
+
+def rerate_review(event_id, old_rating, rating):
+    """Move one counted rating from old_rating to rating, in a single UPDATE."""
+    if old_rating == rating:
+        return
+    Event.objects.filter(id=event_id).update(**{
+        "rating_sum": F("rating_sum") + (rating - old_rating),
+        star_field(old_rating): F(star_field(old_rating)) - 1,
+        star_field(rating): F(star_field(rating)) + 1,
+    })
+
+
+def rebuild_review_stats(events=None):
+    """Recompute the aggregates of `events` (default: all) from the Review rows.
+
+    One UPDATE with a correlated subquery per column; returns rows updated.
+    """
+    events = Event.objects.all() if events is None else events
+    return events.update(**review_stats_expressions(Review))
+
+
+def review_stats_expressions(review_model):
+    def aggregate(expression, **filters):
+        rows = (
+            review_model.objects.filter(event=OuterRef("pk"), **filters)
+            .order_by().values("event").annotate(value=expression).values("value")
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    stats = {
+        "review_count": aggregate(Count("id")),
+        "rating_sum": aggregate(Sum("rating")),
+    }
+    for rating in STARS:
+        stats[star_field(rating)] = aggregate(Count("id"), rating=rating)
+    return stats
+
+
+def average_rating(event):
+    return round(event.rating_sum / event.review_count, 2) if event.review_count else None
+
+
+def rating_histogram(event):
+    return {str(rating): getattr(event, star_field(rating)) for rating in STARS}
+
+
+### Keyset pagination on id, newest first
+def encode_cursor(review):
+    return base64.urlsafe_b64encode(str(review.id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HttpError(400, "Invalid cursor")
+
+
+async def apaginate(qs, cursor=None, limit=None):
+    """Return (reviews, next_cursor) for one page of qs."""
+    limit = max(1, min(limit or REVIEW_PAGE_SIZE, MAX_REVIEW_PAGE_SIZE))
+    qs = qs.order_by("-id")
+    if cursor:
+        qs = qs.filter(id__lt=decode_cursor(cursor))
+    reviews = [review async for review in qs[: limit + 1]]
+    next_cursor = encode_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    return reviews[:limit], next_cursor
@@ -0,0 +1,142 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+# SQLite: one FTS5 row per event (rowid = event id), kept current by triggers
+# so every write path is covered, including bulk_create, queryset.update()
+# and raw SQL. Other databases fall back to icontains. Migration 0013
+# creates the table; install() below adds the triggers.
+FTS_TABLE = "general_event_fts"
+
+# bm25 column weights: title, description, unique_aspect, location, tags
+BM25_WEIGHTS = (10.0, 1.0, 2.0, 4.0, 5.0)
+
+INDEX_EVENTS = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, unique_aspect, location, tags)
+    SELECT e.id, e.title, e.description, e.unique_aspect, e.location,
+           COALESCE((SELECT group_concat(t.tag_name, ' ')
+                     FROM general_event_tags et JOIN general_eventtags t ON t.id = et.eventtags_id
+                     WHERE et.event_id = e.id), '')
+    FROM general_event e
+    WHERE {{where}}
+"""
+
+
+def reindex(event_ids):
+    return (
+        f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({event_ids});"
+        + INDEX_EVENTS.format(where=f"e.id IN ({event_ids})") + ";"
+    )
+
+
+TRIGGERS = {
+    "general_event_fts_insert": f"AFTER INSERT ON general_event BEGIN {reindex('NEW.id')} END",
+    # number_of_bookings updates don't touch an indexed column, so they skip this
+    "general_event_fts_update": (
+        "AFTER UPDATE OF title, description, unique_aspect, location ON general_event "
+        f"BEGIN {reindex('NEW.id')} END"
+    ),
+    "general_event_fts_delete": f"AFTER DELETE ON general_event BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id; END",
+    "general_event_fts_tag_added": f"AFTER INSERT ON general_event_tags BEGIN {reindex('NEW.event_id')} END",
+    "general_event_fts_tag_removed": f"AFTER DELETE ON general_event_tags BEGIN {reindex('OLD.event_id')} END",
+    "general_event_fts_tag_renamed": (
+        "AFTER UPDATE OF tag_name ON general_eventtags "
+        f"BEGIN {reindex('SELECT event_id FROM general_event_tags WHERE eventtags_id = NEW.id')} END"
+    ),
+}
+
+
+def install(connection):
+    """Create the sync triggers if missing, then refill the index.
+
+    Runs after every migrate, pairing with drop_triggers() before it: SQLite
+    rebuilds a table for most ALTERs, which fails while triggers on other
+    tables still reference it and drops the table's own triggers. A no-op
+    until migration 0013 has created the index table.
+    """
+    if connection.vendor != "sqlite" or FTS_TABLE not in connection.introspection.table_names():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+            % ", ".join(["%s"] * len(TRIGGERS)),
+            list(TRIGGERS),
+        )
+        if {name for (name,) in cursor.fetchall()} == set(TRIGGERS):
+            return False
+        for name, body in TRIGGERS.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        rebuild(cursor)
+    return True
+
+
+def drop_triggers(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild(cursor):
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    cursor.execute(INDEX_EVENTS.format(where="1"))
+
+
+def match_expression(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each token keeps user input from being parsed as FTS5 syntax.
+    """
+    tokens = re.findall(r"\w+", q or "")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def uses_fts(qs):
+    return connections[qs.db].vendor == "sqlite"
+
+
+def filter_search(qs, q):
+    """Restrict an Event queryset to rows matching `q` (a no-op for blank input)."""
+    expression = match_expression(q)
+    if not expression:
+        return qs
+    if uses_fts(qs):
+        column = f'"{qs.model._meta.db_table}"."id"'
+        return qs.filter(RawSQL(
+            f"{column} IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)",
+            (expression,),
+            output_field=BooleanField(),
+        ))
+
+    for token in re.findall(r"\w+", q):
+        tag_matches = qs.model.tags.through.objects.filter(
+            eventtags__tag_name__icontains=token
+        ).values("event_id")
+        qs = qs.filter(
+            Q(title__icontains=token) | Q(description__icontains=token)
+            | Q(unique_aspect__icontains=token) | Q(location__icontains=token)
+            | Q(id__in=tag_matches)
+        )
+    return qs
+
+
+def relevance(using, q):
+    """Map event id -> bm25 score (lower is more relevant) for every match of `q`.
+
+    One pass over the FTS index, no join: callers intersect it with their
+    already filtered rows. Empty when full-text search isn't available.
+    """
+    expression = match_expression(q)
+    connection = connections[using]
+    if not expression or connection.vendor != "sqlite":
+        return {}
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [expression],
+        )
+        return dict(cursor.fetchall())
@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_migrate, pre_save
+from django.dispatch import receiver
+
+from . import images, search
+from .reviews import record_review, rerate_review
+from .cache import api_cache
+from .jobs import enqueue
+from .models import AllowedDM, Booking, Event, EventTags, FeedChange, Review
+
+
+### Feed snapshot change log (general/feed.py)
+# Connected before the cache invalidation below, so a row is logged before
+# the version it belongs to moves; readers that see the new version find it
+@receiver([post_save, post_delete], sender=Event)
+def log_event_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        FeedChange.record(instance.id)
+
+
+# Bookings move number_of_bookings, reviews the rating aggregates
+@receiver([post_save, post_delete], sender=Booking)
+@receiver([post_save, post_delete], sender=Review)
+def log_event_child_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        FeedChange.record(instance.event_id)
+
+
+@receiver(m2m_changed, sender=Event.tags.through)
+def log_event_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        FeedChange.record(instance.pk)
+    elif pk_set:
+        FeedChange.record(*pk_set)
+    else:
+        FeedChange.record()  # tag.events.clear() doesn't say which events lost the tag
+
+
+# A renamed or deleted tag changes every event carrying it
+@receiver(post_save, sender=EventTags)
+@receiver(post_delete, sender=EventTags)
+def log_tag_change(sender, created=False, raw=False, **kwargs):
+    if not (created or raw):
+        FeedChange.record()
+
+
+### Cache invalidation
+# Each sender maps to the cache namespaces whose payloads include its rows
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Booking)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_events(sender, **kwargs):
+    api_cache.bump("events")
+
+
+@receiver([post_save, post_delete], sender=EventTags)
+def invalidate_tags(sender, **kwargs):
+    api_cache.bump("tags", "events")
+
+
+@receiver(m2m_changed, sender=Event.tags.through)
+def invalidate_event_tags(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        api_cache.bump("events")
+
+
+# Event detail embeds the host's name and picture. Logging in saves
+# last_login alone, which no cached payload shows
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_users(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    api_cache.bump("users")
+
+
+# start_dm and create_user write AllowedDM; only the two users' lists change
+@receiver([post_save, post_delete], sender=AllowedDM)
+def invalidate_allowed_dms(sender, instance, **kwargs):
+    api_cache.bump(f"dms:{instance.user1_id}", f"dms:{instance.user2_id}")
+
+
+### Review aggregates
+# Reviews can be edited in the admin: remember what was counted before the save
+@receiver(pre_save, sender=Review)
+def note_counted_rating(sender, instance, raw=False, **kwargs):
+    instance._counted = None
+    if not raw and instance.pk is not None:
+        instance._counted = sender.objects.filter(pk=instance.pk).values_list("event_id", "rating").first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    counted = getattr(instance, "_counted", None)
+    if created or counted is None:
+        record_review(instance.event_id, instance.rating)
+    elif counted[0] != instance.event_id:
+        record_review(*counted, delta=-1)
+        record_review(instance.event_id, instance.rating)
+    else:
+        rerate_review(instance.event_id, counted[1], instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    record_review(instance.event_id, instance.rating, delta=-1)
+
+
+### Image derivatives
+@receiver(post_save, sender=Event)
+def queue_event_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and images.pending(instance.photos or [], instance.photo_variants):
+        enqueue("image_derivatives", model="event", id=instance.id)
+
+
+# Only a new picture needs derivatives, not every profile or login save
+@receiver(pre_save, sender=get_user_model())
+def note_profile_pic_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._profile_pic_changed = False
+    if raw or not instance.profile_pic or (update_fields is not None and "profile_pic" not in update_fields):
+        return
+    stored = None
+    if instance.pk is not None:
+        stored = sender.objects.filter(pk=instance.pk).values_list("profile_pic", flat=True).first()
+    instance._profile_pic_changed = stored != instance.profile_pic.name
+
+
+@receiver(post_save, sender=get_user_model())
+def queue_profile_pic_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, "_profile_pic_changed", False):
+        return
+    if images.pending([instance.profile_pic.url], instance.profile_pic_variants):
+        enqueue("image_derivatives", model="user", id=instance.id)
+
+
+### SQLite tuning
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+### Full-text search
+# SQLite table rebuilds during ALTERs trip over the FTS sync triggers, so
+# they are dropped for the migration run and reinstalled (with a reindex) after
+@receiver(pre_migrate)
+def drop_search_triggers(sender, using, **kwargs):
+    if sender.name == "general":
+        search.drop_triggers(connections[using])
+
+
+@receiver(post_migrate)
+def reinstall_search_triggers(sender, using, **kwargs):
+    if sender.name == "general":
+        search.install(connections[using])
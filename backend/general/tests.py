@@ -1,3 +1,1042 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from unittest import mock, skipUnless
+from django.test.utils import CaptureQueriesContext
+from geopy.distance import geodesic
+from PIL import Image
+from django.utils import timezone
+
+from .cache import api_cache
+from .events import events_with_tag_names
+from .feed import feed, has, members
+from .geo import bounding_box, distances_within_radius, filter_bounding_box, haversine_miles, uses_postgis
+from .mail import PooledMailer
+from .metrics import registry
+from . import jobs
+from .models import AllowedDM, Booking, EmailDelivery, Event, EventTags, FeedChange, Job, Review
+from .reviews import rating_histogram, rebuild_review_stats
+
+
+def create_events(count, tags, **overrides):
+    start = timezone.now() + timedelta(days=1)
+    events = []
+    for i in range(count):
+        fields = {
+            "title": f"Event {i}",
+            "location": "Denver, CO",
+            "approved": True,
+            "occurence_date": start + timedelta(hours=i),
+            "number_of_guests": 10,
+        }
+        fields.update(overrides)
+        event = Event.objects.create(**fields)
+        event.tags.set(tags[: i % len(tags) + 1])
+        events.append(event)
+    return events
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Rolled-back test data never fires invalidation signals
+        api_cache.clear()
+        # ... and takes the feed's change log with it
+        feed.reset()
+
+
+class EventListQueryBudgetTests(APITestCase):
+    # One query for the events, one for all of their tags
+    QUERY_BUDGET = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            EventTags.objects.create(tag_name=name, description="")
+            for name in ("music", "dance", "comedy")
+        ]
+
+    def assert_budget(self, url, expected_count):
+        # The database path; FeedSnapshotTests covers the in-memory one
+        with self.assertNumQueries(self.QUERY_BUDGET), mock.patch.object(feed, "answers", return_value=False):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), expected_count)
+        return response.json()
+
+    def test_get_all_query_count_does_not_grow_with_events(self):
+        create_events(5, self.tags)
+        self.assert_budget("/api/general/event/get_all", 5)
+
+        create_events(50, self.tags)
+        events = self.assert_budget("/api/general/event/get_all", 55)
+        self.assertTrue(all(event["tags"] for event in events))
+
+    def test_tag_filters_stay_within_budget(self):
+        create_events(30, self.tags)
+        events = self.assert_budget("/api/general/event/get_all?tags_include=dance,comedy", 20)
+        self.assertTrue(all({"dance", "comedy"} & set(event["tags"]) for event in events))
+
+        events = self.assert_budget("/api/general/event/get_all?tags_exclude=comedy", 20)
+        self.assertTrue(all("comedy" not in event["tags"] for event in events))
+
+    def test_get_event_by_id_loads_host_and_tags_eagerly(self):
+        event = create_events(1, self.tags)[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/general/event/id/{event.id}")
+        self.assertEqual(response.json()["tags"], ["music"])
+
+
+class FeedSnapshotTests(APITestCase):
+    URL = "/api/general/event/get_all?"
+    # What the landing page sends: nothing at first, then EventFilterBar's query
+    FRONTEND_QUERIES = (
+        "",
+        "sort_by_date=true",
+        "tags_include=music%2Ccomedy&tags_exclude=dance&available_only=true&sort_by_date=true",
+        "tags_include=dance&show_old=true&sort_by_date=true",
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = get_user_model().objects.create_user(username="guest", password="pw")
+        tags = [EventTags.objects.create(tag_name=n, description="") for n in ("music", "dance", "comedy")]
+        cls.events = create_events(8, tags)
+        create_events(2, tags[1:], occurence_date=timezone.now() - timedelta(days=3), title="Past")
+        create_events(1, tags, occurence_date=None, title="Undated")
+        create_events(1, tags, title="Full", number_of_guests=1, number_of_bookings=1)
+        create_events(1, tags, title="Hidden", approved=False)
+
+    def get(self, params=""):
+        response = self.client.get(self.URL + params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), response.get("X-Next-Cursor")
+
+    def test_frontend_queries_are_served_from_the_snapshot(self):
+        self.get()
+        for params in self.FRONTEND_QUERIES:
+            with self.assertNumQueries(0):
+                served = self.get(params)
+            with mock.patch.object(feed, "answers", return_value=False):
+                self.assertEqual(served, self.get(params), params)
+
+    def test_matches_the_database_path(self):
+        for params in ("show_old=false", "show_old=false&tags_include=comedy", "tags_include=comedy",
+                       "available_only=true&show_old=false", "limit=3", "limit=3&show_old=false"):
+            api_cache.clear()
+            with mock.patch.object(feed, "answers", return_value=False):
+                expected = self.get(params)
+            self.assertEqual(self.get(params), expected, params)
+
+        seen, cursor = [], None
+        while True:
+            events, cursor = self.get(f"limit=2&tags_exclude=comedy&cursor={cursor}" if cursor else
+                                      "limit=2&tags_exclude=comedy")
+            seen += [event["id"] for event in events]
+            if not cursor:
+                break
+        with mock.patch.object(feed, "answers", return_value=False):
+            events, _ = self.get("limit=200&tags_exclude=comedy")
+        self.assertEqual(seen, [event["id"] for event in events])
+
+    def test_other_filters_use_the_database(self):
+        for params in ("fields=title,thumbnail", "date_after=2020-01-01&sort_by_date=true", "q=jazz",
+                       "user_lat=39.7&user_lon=-104.9&radius=25&location=Denver&sort_by_date=true",
+                       "sort_by_date=false"):
+            with mock.patch.object(feed, "snapshot") as snapshot:
+                self.get(params)
+            snapshot.assert_not_called()
+
+    def test_too_many_events_fall_back_to_the_database(self):
+        with self.settings(FEED_MAX_EVENTS=5):
+            with mock.patch.object(feed, "answers", return_value=False):
+                expected = self.get()
+            api_cache.clear()
+            self.assertEqual(self.get(), expected)
+            self.assertIsNone(feed.snapshot())
+            Event.objects.exclude(title="Hidden").exclude(id=self.events[0].id).delete()
+            self.assertEqual([e["id"] for e in self.get()[0]], [self.events[0].id])
+            self.assertIsNotNone(feed.snapshot())
+
+    def assert_tag_index_matches_sql(self):
+        snapshot = feed.snapshot()
+        upcoming = Event.objects.filter(approved=True)
+        ids = set(Event.objects.values_list("id", flat=True))
+        combos = [("music", None), ("dance,comedy", None), (None, "comedy"),
+                  ("music,comedy", "dance"), ("opera", None), (None, "opera")]
+        for include, exclude in combos:
+            qs = upcoming
+            if include:
+                qs = qs.filter(id__in=events_with_tag_names(include.split(",")))
+            if exclude:
+                qs = qs.exclude(id__in=events_with_tag_names(exclude.split(",")))
+            view = members(snapshot.matching(include, exclude))
+            self.assertEqual({n for n in ids if has(view, n)}, set(qs.values_list("id", flat=True)),
+                             (include, exclude))
+
+    def test_tag_index_follows_m2m_changes(self):
+        self.assert_tag_index_matches_sql()
+        music, dance, comedy = (EventTags.objects.get(tag_name=n) for n in ("music", "dance", "comedy"))
+        self.events[0].tags.add(comedy)
+        self.events[1].tags.remove(music)
+        self.events[2].tags.clear()
+        dance.events.add(self.events[3])
+        comedy.events.remove(*self.events[4:6])
+        self.assert_tag_index_matches_sql()
+        music.events.clear()
+        self.assert_tag_index_matches_sql()
+
+    def test_reads_skip_the_database_until_a_write(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.get("tags_include=dance&limit=2")
+
+        # Booking the last seat, in register_booking's order: counter, then row
+        event = self.events[0]
+        Event.objects.filter(id=event.id).update(number_of_guests=1, number_of_bookings=1)
+        Booking.objects.create(event=event, guest=self.guest)
+        # Only that event is reloaded: the change log, the event, its tags
+        with self.assertNumQueries(3):
+            available, _ = self.get("available_only=true")
+        self.assertNotIn(event.id, [e["id"] for e in available])
+
+        # A tag rename touches every tagged event: full reload
+        dancing, _ = self.get("tags_include=dance")
+        dance = EventTags.objects.get(tag_name="dance")
+        dance.tag_name = "ballet"
+        dance.save()
+        renamed, _ = self.get("tags_include=ballet")
+        self.assertEqual([e["id"] for e in renamed], [e["id"] for e in dancing])
+        self.assertEqual(self.get("tags_include=dance")[0], [])
+
+        hidden = Event.objects.get(title="Hidden")
+        hidden.approved = True
+        hidden.save()
+        self.assertIn(hidden.id, [e["id"] for e in self.get()[0]])
+
+    def test_change_log_is_pruned_while_syncing(self):
+        self.get()
+        with mock.patch("general.feed.KEEP_CHANGES", 5), mock.patch("general.feed.PRUNE_EVERY", 3):
+            for i in range(12):
+                self.events[i % 8].save()
+                self.get()  # patched in by sync(), never a full rebuild
+        self.assertLessEqual(FeedChange.objects.count(), 5 + 3)
+
+
+class EventListPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tags = [EventTags.objects.create(tag_name="music", description="")]
+        cls.events = create_events(7, tags)
+        # Same timestamp as another event and a missing date exercise the id tiebreak
+        create_events(1, tags, occurence_date=cls.events[3].occurence_date)
+        create_events(1, tags, occurence_date=None)
+
+    def test_cursor_walks_every_event_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            url = "/api/general/event/get_all?limit=2"
+            if cursor:
+                url += f"&cursor={cursor}"
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.json()), 2)
+            seen += [event["id"] for event in response.json()]
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        expected = list(
+            Event.objects.order_by(F("occurence_date").asc(nulls_first=True), "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_fields_projection(self):
+        response = self.client.get("/api/general/event/get_all?limit=3&fields=title,thumbnail")
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(set(response.json()[0]), {"id", "title", "thumbnail"})
+        self.assertTrue(response.has_header("X-Next-Cursor"))
+
+    def test_unknown_field_and_bad_cursor_are_rejected(self):
+        self.assertEqual(self.client.get("/api/general/event/get_all?fields=secret").status_code, 400)
+        self.assertEqual(self.client.get("/api/general/event/get_all?cursor=garbage").status_code, 400)
+        # Well-formed JSON whose date doesn't parse: ["x", 1]
+        self.assertEqual(self.client.get("/api/general/event/get_all?cursor=WyJ4IiwxXQ").status_code, 400)
+
+
+class EventStreamingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tags = [EventTags.objects.create(tag_name="music", description="")]
+        create_events(12, tags)
+
+    def read_stream(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_stream_matches_list_response(self):
+        expected = self.client.get("/api/general/event/get_all").json()
+        body = self.read_stream("/api/general/event/get_all?stream=ndjson")
+        self.assertEqual([json.loads(line) for line in body.splitlines()], expected)
+
+    def test_json_array_stream_with_projection(self):
+        body = self.read_stream("/api/general/event/get_all?stream=json&fields=title")
+        self.assertEqual([set(row) for row in json.loads(body)], [{"id", "title"}] * 12)
+
+    def test_unknown_stream_format_is_rejected(self):
+        self.assertEqual(self.client.get("/api/general/event/get_all?stream=xml").status_code, 400)
+
+
+class APICacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [EventTags.objects.create(tag_name="music", description="")]
+        cls.event = create_events(1, cls.tags)[0]
+
+    def test_repeat_requests_are_served_from_cache(self):
+        urls = [
+            "/api/general/event/get_all?fields=title,tags",
+            f"/api/general/event/id/{self.event.id}",
+            "/api/general/tags",
+        ]
+        first = [self.client.get(url).json() for url in urls]
+        with self.assertNumQueries(0):
+            second = [self.client.get(url).json() for url in urls]
+        self.assertEqual(first, second)
+        self.assertGreaterEqual(api_cache.stats()["hits_local"], 3)
+
+    def test_writes_invalidate_dependent_entries(self):
+        url = f"/api/general/event/id/{self.event.id}"
+        self.client.get(url)
+        self.client.get("/api/general/event/get_all")
+
+        self.event.title = "Renamed"
+        self.event.save()
+        self.assertEqual(self.client.get(url).json()["title"], "Renamed")
+
+        new_tag = EventTags.objects.create(tag_name="dance", description="")
+        self.event.tags.add(new_tag)
+        events = self.client.get("/api/general/event/get_all").json()
+        self.assertEqual(events[0]["tags"], ["music", "dance"])
+        self.assertIn("dance", [t["tag_name"] for t in self.client.get("/api/general/tags").json()["tags"]])
+
+    def test_login_keeps_cached_event_details(self):
+        get_user_model().objects.create_user(username="guest", password="pw")
+        before = api_cache.versions(("users",))
+        self.assertTrue(self.client.login(username="guest", password="pw"))
+        self.assertEqual(api_cache.versions(("users",)), before)
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get("/api/general/cache/stats").status_code, 403)
+
+
+class ConditionalRequestTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_events(1, [EventTags.objects.create(tag_name="music", description="")])[0]
+
+    def test_matching_etag_short_circuits_to_304(self):
+        for url in ("/api/general/event/get_all", f"/api/general/event/id/{self.event.id}", "/api/general/tags"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            api_cache.local.clear()
+            with self.assertNumQueries(0):
+                revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated["ETag"], response["ETag"])
+
+            revalidated = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(revalidated.status_code, 304)
+
+    def test_only_time_relative_queries_roll_with_the_clock(self):
+        urls = ["/api/general/event/get_all", f"/api/general/event/id/{self.event.id}", "/api/general/tags",
+                "/api/general/event/get_all?show_old=false", "/api/general/event/get_all?date=2030-01-01"]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        later = time.time() + 2 * api_cache.ttl
+        with mock.patch("general.cache.time.time", return_value=later):
+            rolled = [self.client.get(url, HTTP_IF_NONE_MATCH=etag) for url, etag in zip(urls, etags)]
+        self.assertEqual([response.status_code for response in rolled], [304, 304, 304, 200, 200])
+
+    def test_write_changes_the_etag(self):
+        url = f"/api/general/event/id/{self.event.id}"
+        etag = self.client.get(url)["ETag"]
+        self.event.title = "Renamed"
+        self.event.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["title"], "Renamed")
+
+
+class BookingCounterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_events(1, [EventTags.objects.create(tag_name="music", description="")],
+                                  number_of_guests=2)[0]
+        cls.guests = [
+            get_user_model().objects.create_user(username=f"guest{i}", password="pw")
+            for i in range(3)
+        ]
+
+    def book(self, guest):
+        self.client.force_login(guest)
+        return self.client.post(f"/api/general/booking/register/{self.event.id}")
+
+    def test_capacity_is_never_exceeded(self):
+        self.assertEqual(self.book(self.guests[0]).status_code, 200)
+        self.assertEqual(self.book(self.guests[0]).json()["message"], "Booking already exists")
+        self.assertEqual(self.book(self.guests[1]).status_code, 200)
+        self.assertEqual(self.book(self.guests[2]).status_code, 409)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.number_of_bookings, 2)
+        self.assertEqual(Booking.objects.filter(event=self.event).count(), 2)
+
+    def test_delete_releases_one_seat(self):
+        booking_id = self.book(self.guests[0]).json()["id"]
+        self.client.delete(f"/api/general/booking/delete/{booking_id}")
+        self.assertEqual(self.client.delete(f"/api/general/booking/delete/{booking_id}").status_code, 404)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.number_of_bookings, 0)
+        self.assertEqual(self.book(self.guests[1]).status_code, 200)
+
+
+class RadiusSearchTests(APITestCase):
+    ORIGIN = (39.7392, -104.9903)  # Denver
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [EventTags.objects.create(tag_name="music", description="")]
+        places = [(39.74, -104.99), (40.015, -105.27), (38.83, -104.82), (39.53, -107.32), (35.08, -106.65)]
+        for lat, lon in places:
+            create_events(1, tags, latitude=lat, longitude=lon)
+        create_events(1, tags)  # no coordinates
+
+    def search(self, radius):
+        lat, lon = self.ORIGIN
+        url = f"/api/general/event/get_all?user_lat={lat}&user_lon={lon}&radius={radius}&sort_by_distance=true"
+        return self.client.get(url).json()
+
+    def test_matches_geodesic_reference(self):
+        for radius in (1, 30, 80, 150, 400):
+            expected = {
+                event.id for event in Event.objects.exclude(latitude=None)
+                if geodesic(self.ORIGIN, (event.latitude, event.longitude)).miles <= radius
+            }
+            events = self.search(radius)
+            self.assertEqual({event["id"] for event in events}, expected, radius)
+            distances = [event["distance_miles"] for event in events]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_sort_by_distance_without_the_distance_field(self):
+        lat, lon = self.ORIGIN
+        url = (f"/api/general/event/get_all?user_lat={lat}&user_lon={lon}&radius=400"
+               f"&sort_by_distance=true&fields=title")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event["id"] for event in response.json()], [event["id"] for event in self.search(400)])
+        self.assertNotIn("distance_miles", response.json()[0])
+
+    def test_postgis_profile_filters_in_the_database(self):
+        if not uses_postgis(Event.objects.all()):
+            self.skipTest("runs on the postgis profile only")
+        with CaptureQueriesContext(connection) as queries:
+            self.search(80)
+        self.assertTrue(any("ST_DWithin" in query["sql"] for query in queries))
+
+
+class BoundingBoxTests(TestCase):
+    def within(self, lat, lon, radius):
+        return set(filter_bounding_box(Event.objects.all(), lat, lon, radius).values_list("id", flat=True))
+
+    def test_box_wraps_the_antimeridian(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(0.0, 179.5, 100)
+        self.assertGreater(min_lon, max_lon)
+        west = Event.objects.create(title="Fiji", latitude=0.5, longitude=-179.6)
+        east = Event.objects.create(title="Kiribati", latitude=-0.5, longitude=179.9)
+        far = Event.objects.create(title="Mid-Pacific", latitude=0.0, longitude=170.0)
+        # Right on the box's wrapped edges
+        edge = Event.objects.create(title="Edge", latitude=max_lat, longitude=max_lon)
+        self.assertEqual(self.within(0.0, 179.5, 100), {west.id, east.id, edge.id})
+        self.assertEqual(set(distances_within_radius(Event.objects.all(), 0.0, 179.5, 100)), {west.id, east.id})
+        self.assertNotIn(far.id, distances_within_radius(Event.objects.all(), 0.0, 179.5, 100))
+
+    def test_box_near_a_pole_spans_every_longitude(self):
+        _, max_lat, min_lon, max_lon = bounding_box(89.5, 10.0, 100)
+        self.assertEqual((max_lat, min_lon, max_lon), (90.0, -180.0, 180.0))
+        self.assertEqual(bounding_box(-89.9, 0.0, 50)[0], -90.0)
+        opposite = Event.objects.create(title="Across the pole", latitude=89.6, longitude=-170.0)
+        self.assertIn(opposite.id, distances_within_radius(Event.objects.all(), 89.5, 10.0, 100))
+
+    def test_matches_a_full_scan(self):
+        rng = random.Random(1)
+        centers = [(39.7, -105.0), (0.0, 179.9), (-0.5, -179.9), (88.0, 45.0), (-87.5, -120.0)]
+        for lat, lon in centers:
+            for _ in range(60):
+                Event.objects.create(
+                    title="Random",
+                    latitude=max(-90.0, min(90.0, lat + rng.uniform(-6, 6))),
+                    longitude=(lon + rng.uniform(-12, 12) + 180) % 360 - 180,
+                )
+        rows = list(Event.objects.values_list("id", "latitude", "longitude"))
+        ids, lats, lons = zip(*rows)
+        for lat, lon in centers:
+            for radius in (25, 150, 400):
+                # What the radius filter did before the prefilter: every row through the distance check
+                distances = haversine_miles(lat, lon, lats, lons)
+                expected = {event_id for event_id, dist in zip(ids, distances) if dist <= radius}
+                self.assertEqual(set(distances_within_radius(Event.objects.all(), lat, lon, radius)),
+                                 expected, (lat, lon, radius))
+
+
+class HaversineTests(TestCase):
+    # Sphere vs. WGS84 ellipsoid: the spherical formula stays within 0.6% of geopy
+    TOLERANCE = 0.006
+
+    def test_matches_geopy_within_tolerance(self):
+        rng = random.Random(2)
+        origins = [(39.7392, -104.9903), (0.0, 179.9), (-33.9, 18.4), (89.0, 0.0)]
+        for lat, lon in origins:
+            lats = [rng.uniform(-90, 90) for _ in range(200)]
+            lons = [rng.uniform(-180, 180) for _ in range(200)]
+            distances = haversine_miles(lat, lon, lats, lons)
+            for dist, point in zip(distances, zip(lats, lons)):
+                expected = geodesic((lat, lon), point).miles
+                self.assertAlmostEqual(dist, expected, delta=max(expected * self.TOLERANCE, 0.01))
+        # Short hops, where the radius filter actually decides
+        self.assertAlmostEqual(haversine_miles(39.7392, -104.9903, [40.015], [-105.27])[0],
+                               geodesic((39.7392, -104.9903), (40.015, -105.27)).miles, delta=0.15)
+
+
+class JobQueueTests(TestCase):
+    def test_signup_email_is_queued_and_sent_by_worker(self):
+        response = self.client.post("/api/general/user/create", {
+            "username": "newbie", "password": "secret123", "email": "newbie@example.com",
+            "first_name": "New", "last_name": "Bie", "role": "traveler",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.get().kind, "send_email")
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["newbie@example.com"])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_email_batch_records_deliveries_in_one_insert(self):
+        for i in range(3):
+            jobs.enqueue_email("Hi", "Welcome", [f"guest{i}@example.com"])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(jobs.run_pending(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailDelivery.objects.filter(status=EmailDelivery.SENT).count(), 3)
+        # One bulk insert for the delivery log, not one per message
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "general_emaildelivery"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_failed_message_is_not_resent_to_earlier_recipients(self):
+        sent = []
+
+        class FlakyConnection:
+            def open(self):
+                pass
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                for message in messages:
+                    if message.to == ["bounce@example.com"]:
+                        raise OSError("550 mailbox unavailable")
+                    sent.append(message.to[0])
+                return len(messages)
+
+        messages = [mail.EmailMessage("Hi", "Welcome", to=[to]) for to in
+                    ("a@example.com", "b@example.com", "bounce@example.com", "c@example.com")]
+        mailer = PooledMailer(batch_size=10, connection_factory=FlakyConnection)
+        with self.assertLogs("general.mail", "WARNING"):
+            outcomes = mailer.send(messages)
+        self.assertEqual(sent, ["a@example.com", "b@example.com", "c@example.com"])
+        self.assertEqual([error is None for error in outcomes], [True, True, False, True])
+        self.assertEqual(
+            list(EmailDelivery.objects.order_by("id").values_list("status", flat=True)),
+            [EmailDelivery.SENT, EmailDelivery.SENT, EmailDelivery.FAILED, EmailDelivery.SENT],
+        )
+
+    def test_failures_back_off_then_give_up(self):
+        calls = []
+
+        @jobs.job("always_fails")
+        def always_fails(payload):
+            calls.append(payload)
+            raise RuntimeError("boom")
+
+        self.addCleanup(jobs.HANDLERS.pop, "always_fails")
+        entry = jobs.enqueue("always_fails", n=1)
+        entry.max_attempts = 2
+        entry.save()
+
+        with self.assertLogs("general.jobs", "ERROR"):
+            jobs.run_pending()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (Job.PENDING, 1))
+        self.assertGreater(entry.run_after, timezone.now())
+        self.assertIn("boom", entry.last_error)
+        self.assertEqual(jobs.run_pending(), 0)  # not due yet
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs("general.jobs", "ERROR"):
+            jobs.run_pending()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (Job.FAILED, 2))
+        self.assertEqual(calls, [{"n": 1}, {"n": 1}])
+
+
+class ReviewAggregateTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.event, cls.other = create_events(2, [EventTags.objects.create(tag_name="music", description="")])
+        cls.user = get_user_model().objects.create_user(username="critic", password="pw")
+
+    def review(self, rating, event=None):
+        response = self.client.post(
+            "/api/general/reviews/create",
+            {"event_id": (event or self.event).id, "text": f"{rating} stars", "rating": rating},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_counters_follow_reviews_and_match_a_rebuild(self):
+        self.client.force_login(self.user)
+        for rating in (5, 4, 5, 1):
+            self.review(rating)
+        self.review(3, event=self.other)
+        Review.objects.filter(rating=1).delete()
+
+        detail = self.client.get(f"/api/general/event/id/{self.event.id}").json()
+        self.assertEqual((detail["review_count"], detail["average_rating"]), (3, 4.67))
+        self.assertEqual(detail["rating_histogram"], {"1": 0, "2": 0, "3": 0, "4": 1, "5": 2})
+
+        # The listing reads the counters from the event row: the snapshot's
+        # change log position, the events and their tags, nothing per event
+        with self.assertNumQueries(3):
+            listing = self.client.get("/api/general/event/get_all").json()
+        self.assertEqual(
+            [(e["review_count"], e["average_rating"]) for e in listing], [(3, 4.67), (1, 3.0)]
+        )
+
+        incremental = list(Event.objects.order_by("id").values())
+        Event.objects.update(review_count=0, rating_sum=0, ratings_5=0)
+        rebuild_review_stats()
+        self.assertEqual(list(Event.objects.order_by("id").values()), incremental)
+
+    def test_edited_rating_moves_between_counters(self):
+        self.client.force_login(self.user)
+        for rating in (5, 4):
+            self.review(rating)
+        review = Review.objects.get(rating=5)
+        review.rating = 1
+        review.save()
+        moved = Review.objects.get(rating=4)
+        moved.event = self.other
+        moved.save()
+
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.review_count, self.event.rating_sum), (1, 1))
+        self.assertEqual(rating_histogram(self.event), {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0})
+        incremental = list(Event.objects.order_by("id").values())
+        rebuild_review_stats()
+        self.assertEqual(list(Event.objects.order_by("id").values()), incremental)
+
+    def test_review_list_pages_newest_first(self):
+        self.client.force_login(self.user)
+        for rating in (1, 2, 3, 4, 5):
+            self.review(rating)
+        url = f"/api/general/event/{self.event.id}/reviews?limit=2"
+
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url + (f"&cursor={cursor}" if cursor else ""))
+            pages.append([review["rating"] for review in response.json()])
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(pages, [[5, 4], [3, 2], [1]])
+        self.assertEqual(self.client.get("/api/general/event/999/reviews").status_code, 404)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(APITestCase):
+    """Every query behind the read endpoints must be served from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = get_user_model().objects.create_user(username="host", password="pw", is_host=True)
+        cls.guest = get_user_model().objects.create_user(username="guest", password="pw")
+        tags = [EventTags.objects.create(tag_name=name, description="") for name in ("music", "dance")]
+        cls.events = create_events(5, tags, host=cls.host, latitude=39.74, longitude=-104.99)
+        Booking.objects.create(event=cls.events[0], guest=cls.guest)
+        Review.objects.create(event=cls.events[0], text="Great", rating=5)
+        AllowedDM.objects.create(user1=cls.host, user2=cls.guest)
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.startswith("SELECT") or "sqlite_master" in sql:
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    # "SCAN t" reads the whole table; "SCAN t USING INDEX" walks an index in order
+                    if detail.startswith("SCAN ") and "INDEX" not in detail and "CONSTANT ROW" not in detail:
+                        scans.append((detail, sql))
+        return scans
+
+    def test_read_endpoints_avoid_full_table_scans(self):
+        event_id = self.events[0].id
+        tomorrow = (timezone.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        urls = [
+            "/api/general/event/get_all",
+            "/api/general/event/get_all?show_old=false",
+            f"/api/general/event/get_all?date_after={tomorrow}&date_before=2999-01-01T00:00:00Z",
+            "/api/general/event/get_all?available_only=true&show_old=false",
+            "/api/general/event/get_all?tags_include=music&tags_exclude=dance",
+            "/api/general/event/get_all?q=event",
+            "/api/general/event/get_all?user_lat=39.7&user_lon=-105&radius=20",
+            "/api/general/event/get_all?limit=2&fields=title",
+            f"/api/general/event/id/{event_id}",
+            f"/api/general/event/{event_id}/reviews?limit=1",
+            f"/api/general/host/{self.host.id}/events",
+            f"/api/general/user/{self.guest.id}",
+            "/api/general/user/bookings",
+            "/api/general/user/hosted_events",
+            "/api/general/messaging/allowed-uids",
+        ]
+        scans = []
+        for user in (self.guest, self.host):
+            self.client.force_login(user)
+            for url in urls:
+                api_cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url).status_code, 200, url)
+                scans += [(url, *scan) for scan in self.full_scans(queries)]
+        self.assertEqual(scans, [])
+
+
+class AllowedDMTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        # p0 has a lower id than the user, so its pair stores the user as user2
+        first = User.objects.create_user(username="p0@mail.co", password="pw")
+        cls.user = User.objects.create_user(username="me@example.com", password="pw")
+        cls.partners = [first] + [User.objects.create_user(username=f"p{i}@mail.co", password="pw") for i in range(1, 6)]
+
+    def allowed(self):
+        response = self.client.get("/api/general/messaging/allowed-uids")
+        self.assertEqual(response.status_code, 200)
+        return sorted(response.json())
+
+    def test_one_query_whatever_the_partner_count_and_cached_until_a_new_dm(self):
+        self.client.force_login(self.user)
+        for partner in self.partners[:5]:
+            AllowedDM.objects.create(user1=self.user, user2=partner)
+
+        # The user row (the session comes from the cache), then the union query
+        with self.assertNumQueries(2):
+            self.assertEqual(self.allowed(), [f"p{i}mailco" for i in range(5)])
+        with self.assertNumQueries(1):
+            self.allowed()
+
+        response = self.client.post(
+            "/api/general/messaging/start-dm", {"target_user_id": self.partners[5].id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.allowed(), [f"p{i}mailco" for i in range(6)])
+
+
+class APISessionTests(APITestCase):
+    def test_authenticated_api_call_reads_the_session_from_the_cache(self):
+        user = get_user_model().objects.create_user(username="cached", password="pw")
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db"):
+            self.client.force_login(user)
+            # Only the user row; no django_session SELECT or UPDATE
+            with self.assertNumQueries(1):
+                response = self.client.get("/api/general/user")
+        self.assertEqual(response.json()["username"], "cached")
+        self.assertFalse(hasattr(response.wsgi_request, "_messages"))
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_endpoints_are_timed_and_exposed_in_prometheus_format(self):
+        create_events(3, [EventTags.objects.create(tag_name="music", description="")])
+        self.client.get("/api/general/event/get_all")
+        self.client.get("/api/general/event/get_all")
+        self.client.get("/api/general/event/id/999999")
+
+        self.assertEqual(self.client.get("/api/general/metrics").status_code, 403)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            response = self.client.get("/api/general/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        lines = response.content.decode().splitlines()
+
+        labels = 'endpoint="list_filtered_events",method="GET"'
+        self.assertIn(f"api_request_duration_seconds_count{{{labels}}} 2", lines)
+        # Three queries on the first call (building the feed snapshot), none on the second
+        self.assertIn(f"api_db_queries_sum{{{labels}}} 3.000000", lines)
+        self.assertIn(f'api_db_queries_bucket{{{labels},le="0"}} 1', lines)
+        self.assertIn(f'api_requests_total{{{labels},status="200"}} 2', lines)
+        self.assertIn('api_requests_total{endpoint="get_event_by_id",method="GET",status="404"} 1', lines)
+        self.assertIn("# TYPE api_cache_misses_total counter", lines)
+
+
+class BenchmarkSuiteTests(APITestCase):
+    def seed(self, **options):
+        call_command("seed_data", users=20, events=30, seed=7, stdout=io.StringIO(), **options)
+
+    def test_seed_data_is_reproducible_and_consistent(self):
+        self.seed()
+        titles = list(Event.objects.order_by("id").values_list("title", "number_of_guests"))
+        events = Event.objects.annotate(
+            booked=Count("bookings", distinct=True), reviewed=Count("reviews", distinct=True)
+        )
+        for event in events:
+            self.assertEqual(event.number_of_bookings, event.booked)
+            self.assertLessEqual(event.number_of_bookings, event.number_of_guests)
+            self.assertEqual(event.review_count, event.reviewed)
+        self.assertFalse(AllowedDM.objects.filter(user1_id__gt=F("user2_id")).exists())
+
+        self.seed(clear=True)
+        self.assertEqual(list(Event.objects.order_by("id").values_list("title", "number_of_guests")), titles)
+
+    def test_bench_api_covers_every_endpoint_and_leaves_no_writes(self):
+        self.seed()
+        counts = (get_user_model().objects.count(), Event.objects.count(), Booking.objects.count())
+        out, err = io.StringIO(), io.StringIO()
+        # Sessions and other users of the shared cache must survive the run
+        api_cache.shared.set("bench:unrelated", "kept", None)
+        call_command("bench_api", iterations=1, warmup=0, json=True, cache="cold", stdout=out, stderr=err)
+        self.assertEqual(api_cache.shared.get("bench:unrelated"), "kept")
+
+        self.assertEqual(err.getvalue(), "")  # no router operation without a scenario
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["meta"]["rows"]["events"], 30)
+        for result in report["results"]:
+            self.assertTrue(all(status < 400 for status in result["status"]), result)
+            self.assertGreater(result["p50_ms"], 0)
+        self.assertEqual(
+            (get_user_model().objects.count(), Event.objects.count(), Booking.objects.count()), counts
+        )
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profile_dir = directory.name
+        override = override_settings(PROFILE_DIR=directory.name, PROFILE_KEEP=2)
+        override.enable()
+        self.addCleanup(override.disable)
+        create_events(3, [EventTags.objects.create(tag_name="music", description="")])
+        self.staff = get_user_model().objects.create_user(username="staff", password="pw", is_staff=True)
+
+    def test_only_staff_requests_that_ask_are_profiled(self):
+        response = self.client.get("/api/general/event/get_all", HTTP_X_PROFILE="cprofile")
+        self.assertNotIn("X-Profile-Id", response)
+        self.client.force_login(self.staff)
+        self.assertNotIn("X-Profile-Id", self.client.get("/api/general/event/get_all"))
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_profiles_are_listed_downloaded_and_pruned(self):
+        self.client.force_login(self.staff)
+        first = self.client.get("/api/general/event/get_all", HTTP_X_PROFILE="cprofile")["X-Profile-Id"]
+        second = self.client.get("/api/general/event/get_all?_profile=sample&radius=5")["X-Profile-Id"]
+
+        profiles = self.client.get("/api/general/profiles").json()
+        self.assertEqual([p["id"] for p in profiles], [second, first])
+        self.assertEqual(profiles[0]["path"], "/api/general/event/get_all?_profile=sample&radius=5")
+        self.assertEqual((profiles[0]["mode"], profiles[0]["status"]), ("sample", 200))
+
+        response = self.client.get(f"/api/general/profiles/{first}")
+        path = os.path.join(self.profile_dir, "downloaded.prof")
+        with open(path, "wb") as f:
+            f.write(b"".join(response.streaming_content))
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn("list_filtered_events", functions)
+
+        # PROFILE_KEEP=2: a third profile evicts the oldest
+        self.client.get("/api/general/tags", HTTP_X_PROFILE="sample")
+        self.assertEqual(len(self.client.get("/api/general/profiles").json()), 2)
+        self.assertEqual(self.client.get(f"/api/general/profiles/{first}").status_code, 404)
+        self.assertEqual(self.client.get("/api/general/profiles/..%2Fsecrets").status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/general/profiles").status_code, 403)
+
+
+class EventSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jazz = EventTags.objects.create(tag_name="jazz", description="")
+        cls.outdoors = EventTags.objects.create(tag_name="outdoors", description="")
+        start = timezone.now() + timedelta(days=1)
+
+        def event(title, hours, **fields):
+            return Event.objects.create(
+                title=title, location=fields.pop("location", "Denver, CO"), approved=True,
+                occurence_date=start + timedelta(hours=hours), number_of_guests=10, **fields
+            )
+
+        cls.mention = event("Open mic night", 1, description="Poetry, then a little jazz")
+        cls.headline = event("Jazz brunch", 2, description="Live trio")
+        cls.hike = event("Sunrise hike", 3, description="Bring water", location="Boulder, CO")
+        cls.hike.tags.set([cls.outdoors])
+
+    def search(self, query):
+        response = self.client.get(f"/api/general/event/get_all?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [event["title"] for event in response.json()]
+
+    def test_ranks_title_matches_first_and_matches_prefixes(self):
+        self.assertEqual(self.search("q=jazz"), ["Jazz brunch", "Open mic night"])
+        self.assertEqual(self.search("q=JAZ"), ["Jazz brunch", "Open mic night"])
+        self.assertEqual(self.search("q=boulder"), ["Sunrise hike"])
+        # Every word has to match; FTS syntax in user input is just more words
+        self.assertEqual(self.search("q=jazz+trio"), ["Jazz brunch"])
+        self.assertEqual(self.search('q="jazz" OR NEAR(*'), [])
+
+    def test_index_follows_edits_and_tags(self):
+        self.assertEqual(self.search("q=outdoors"), ["Sunrise hike"])
+        self.hike.tags.add(self.jazz)
+        self.assertEqual(self.search("q=jazz&tags_include=outdoors"), ["Sunrise hike"])
+
+        self.jazz.tag_name = "bebop"
+        self.jazz.save()
+        self.assertEqual(self.search("q=bebop"), ["Sunrise hike"])
+
+        Event.objects.filter(id=self.headline.id).update(title="Blues brunch")
+        self.assertEqual(self.search("q=blues"), ["Blues brunch"])
+        self.headline.delete()
+        self.assertEqual(self.search("q=brunch"), [])
+
+    def test_combines_with_pagination_and_projection(self):
+        response = self.client.get("/api/general/event/get_all?q=jazz&limit=1&fields=title")
+        self.assertEqual(response.json(), [{"id": self.mention.id, "title": "Open mic night"}])
+        cursor = response["X-Next-Cursor"]
+        response = self.client.get(f"/api/general/event/get_all?q=jazz&limit=1&fields=title&cursor={cursor}")
+        self.assertEqual(response.json(), [{"id": self.headline.id, "title": "Jazz brunch"}])
+
+
+class MediaTestCase(APITestCase):
+    """Points MEDIA_ROOT at a throwaway directory."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name, content, event_id=0):
+        response = self.client.post(
+            f"/api/general/upload?event_id={event_id}",
+            {"file": SimpleUploadedFile(name, content, content_type="image/jpeg")},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["fileUrl"]
+
+
+class ContentAddressedUploadTests(MediaTestCase):
+    def stored_files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.media_root)
+            for name in names
+        ]
+
+    def test_identical_content_is_stored_once_across_events(self):
+        first = self.upload("beach.JPG", b"same bytes" * 1000, event_id=1)
+        second = self.upload("copy.jpg", b"same bytes" * 1000, event_id=2)
+        other = self.upload("beach.jpg", b"different bytes", event_id=1)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith("/media/cas/") and first.endswith(".jpg"))
+        # Same-named uploads no longer overwrite each other; no temp files left behind
+        self.assertEqual(len(self.stored_files()), 2)
+        with open(os.path.join(self.media_root, first.removeprefix("/media/")), "rb") as f:
+            self.assertEqual(f.read(), b"same bytes" * 1000)
+
+
+class ImageDerivativeTests(MediaTestCase):
+    def jpeg(self, size=(2400, 1600)):
+        buffer = io.BytesIO()
+        Image.effect_noise(size, 60).convert("RGB").save(buffer, "JPEG", quality=90)
+        return buffer.getvalue()
+
+    def test_photos_get_small_webp_derivatives_in_the_background(self):
+        original = self.jpeg()
+        url = self.upload("party.jpg", original)
+        event = create_events(1, [EventTags.objects.create(tag_name="music", description="")], photos=[url])[0]
+        self.assertEqual(Job.objects.get().kind, "image_derivatives")
+
+        # Until the worker runs, cards fall back to the original
+        response = self.client.get("/api/general/event/get_all?fields=thumbnail,photo_variants")
+        self.assertEqual(response.json()[0]["thumbnail"], url)
+
+        jobs.run_pending()
+        event.refresh_from_db()
+        variants = event.photo_variants[url]
+        self.assertEqual(set(variants), {"thumb.webp", "card.webp"})
+
+        thumb_path = os.path.join(self.media_root, variants["thumb.webp"].removeprefix("/media/"))
+        with Image.open(thumb_path) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ("WEBP", (320, 213)))
+        self.assertLess(os.path.getsize(thumb_path) * 10, len(original))
+
+        response = self.client.get("/api/general/event/get_all?fields=thumbnail,photo_variants")
+        self.assertEqual(response.json()[0]["thumbnail"], variants["thumb.webp"])
+        self.assertEqual(response.json()[0]["photo_variants"], [variants])
+        # Already processed: saving again doesn't queue more work
+        event.save()
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 0)
+
+    def test_profile_pic_derivatives_are_queued_only_for_a_new_picture(self):
+        user = get_user_model().objects.create_user(username="host", password="pw", profile_pic="profile_pics/a.jpg")
+        self.assertEqual(Job.objects.filter(kind="image_derivatives").count(), 1)
+
+        user.first_name = "Renamed"
+        user.save()
+        self.client.login(username="host", password="pw")
+        self.assertEqual(Job.objects.filter(kind="image_derivatives").count(), 1)
+
+        user.profile_pic = "profile_pics/b.jpg"
+        user.save()
+        self.assertEqual(Job.objects.filter(kind="image_derivatives").count(), 2)
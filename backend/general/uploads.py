@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+
+# Uploads live under MEDIA_ROOT/<CAS_DIR>/ab/cd/<sha256><ext>
+CAS_DIR = "cas"
+HASH_ALGORITHM = "sha256"
+
+
+def safe_extension(name):
+    """Lowercased extension of the client's filename, or "" if it looks odd."""
+    ext = os.path.splitext(name or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+
+def content_path(digest, ext):
+    return os.path.join(CAS_DIR, digest[:2], digest[2:4], digest + ext)
+
+
+def store_upload(uploaded):
+    """Stream an UploadedFile into content-addressed storage.
+
+    Chunks are written to a temp file next to the store while being hashed,
+    so memory stays at one chunk whatever the upload size. The temp file is
+    then renamed into place; if identical content was stored before (by any
+    event) it is discarded instead. Returns the path relative to MEDIA_ROOT.
+    """
+    incoming = os.path.join(settings.MEDIA_ROOT, CAS_DIR, "tmp")
+    os.makedirs(incoming, exist_ok=True)
+
+    digest = hashlib.new(HASH_ALGORITHM)
+    # Same filesystem as the final path, so the rename below is atomic
+    fd, tmp_path = tempfile.mkstemp(dir=incoming)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in uploaded.chunks():
+                digest.update(chunk)
+                out.write(chunk)
+
+        relative = content_path(digest.hexdigest(), safe_extension(uploaded.name))
+        final_path = os.path.join(settings.MEDIA_ROOT, relative)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.chmod(tmp_path, 0o644)  # mkstemp creates files as 0600
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return relative
+
+
+def media_url(relative):
+    return settings.MEDIA_URL + relative.replace(os.sep, "/")
@@ -22,6 +22,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Storage settings
 MEDIA_URL = "/media/"  # URL where media files will be served
 MEDIA_ROOT = "/mnt/volume/uploads/"  # Local storage path
+# Resized derivatives of uploaded images (general/images.py); "avif" needs Pillow with AVIF support
+IMAGE_DERIVATIVE_FORMATS = os.getenv("IMAGE_DERIVATIVE_FORMATS", "webp").split(",")
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -41,6 +43,9 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': '/backend/error.log',
         },
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django': {
@@ -48,8 +53,19 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # App events (signups, job failures, ...) go to stdout for the container logs
+        'general': {
+            'handlers': ['console', 'file'],
+            'level': os.getenv("DJANGO_LOG_LEVEL", "INFO"),
+            'propagate': False,
+        },
     },
 }
+# Bearer token Prometheus sends to scrape /api/general/metrics; staff sessions work too
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Request profiles taken with the X-Profile header (general/profiling.py); only the newest PROFILE_KEEP stay
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/mnt/volume/profiles/")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
 # Ensure Django trusts AWS ALB for HTTPS
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True  # Allow Django to use forwarded headers
@@ -77,6 +93,7 @@ CORS_ALLOWED_ORIGINS = os.getenv("DJANGO_CORS_ALLOWED_ORIGINS", default_origins)
 CSRF_TRUSTED_ORIGINS = os.getenv("DJANGO_CSRF_TRUSTED_ORIGINS", default_origins).split(",")
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor"]  # keyset pagination for /event/get_all
 CORS_ALLOW_METHODS = ["GET", "POST", "OPTIONS"]
 CORS_ALLOW_HEADERS = ["*"]
 
@@ -100,6 +117,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # Outermost, so /api/ latency covers the whole stack (general/metrics.py)
+    'general.middleware.MetricsMiddleware',
      #added
     'corsheaders.middleware.CorsMiddleware',
     #'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -108,7 +127,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    # Opt-in per-request profiles for staff (X-Profile header), needs request.user
+    'general.middleware.ProfilingMiddleware',
+    # MessageMiddleware that skips /api/ requests; only admin/HTML views use messages
+    'general.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -136,6 +158,13 @@ WSGI_APPLICATION = 'src.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DJANGO_DB_PROFILE=sqlite (default) keeps persistent connections and tunes
+# SQLite for concurrent gunicorn workers (WAL, see SQLITE_PRAGMAS, applied in
+# general/signals.py); sqlite-stock is Django's untuned setup, for comparison;
+# postgis switches to PostgreSQL/PostGIS (docker compose --profile postgis),
+# where radius searches run as ST_DWithin on a GiST-indexed geography column.
+DB_PROFILE = os.getenv("DJANGO_DB_PROFILE", "sqlite")
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -143,6 +172,75 @@ DATABASES = {
     }
 }
 
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == "sqlite":
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv("DJANGO_CONN_MAX_AGE", "600")),
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds a connection waits on a locked database. The driver applies
+        # it as SQLite's busy_timeout, so it is not repeated in SQLITE_PRAGMAS
+        'OPTIONS': {'timeout': 20},
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # readers no longer block on writers
+        'synchronous': 'NORMAL',  # fsync at checkpoints only; safe with WAL
+        'cache_size': -20000,  # KiB of page cache per connection
+        'mmap_size': 134217728,  # 128 MiB memory-mapped reads
+        'temp_store': 'MEMORY',
+    }
+elif DB_PROFILE == "postgis":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.contrib.gis.db.backends.postgis',
+            'NAME': os.getenv("POSTGRES_DB", "local"),
+            'USER': os.getenv("POSTGRES_USER", "local"),
+            'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+            'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+            'PORT': os.getenv("POSTGRES_PORT", "5432"),
+            'CONN_MAX_AGE': int(os.getenv("DJANGO_CONN_MAX_AGE", "600")),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    INSTALLED_APPS += ['django.contrib.gis']
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# API responses are cached per process (LRU) in front of this shared backend.
+# "file" is shared by every gunicorn worker in the container, and with the job
+# worker when DJANGO_CACHE_DIR is a shared volume (see docker-compose); "locmem" is per
+# process (fine for tests/runserver); "redis" talks to any Redis-compatible
+# server such as the valkey service in docker-compose (needs `pip install redis`).
+CACHE_BACKEND = os.getenv("DJANGO_CACHE_BACKEND", "file")
+
+if CACHE_BACKEND == "redis":
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("DJANGO_CACHE_URL", "redis://127.0.0.1:6379/1"),
+        }
+    }
+elif CACHE_BACKEND == "locmem":
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv("DJANGO_CACHE_DIR", "/tmp/local_api_cache"),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+API_CACHE_ALIAS = "default"
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "60"))  # seconds
+API_CACHE_LOCAL_SIZE = int(os.getenv("API_CACHE_LOCAL_SIZE", "512"))  # entries per process
+# Approved events the in-memory listing snapshot holds per process; beyond that the listing reads the database
+FEED_MAX_EVENTS = int(os.getenv("FEED_MAX_EVENTS", "20000"))
+
 AUTH_USER_MODEL = 'general.CustomUser'
 
 # Password validation
@@ -202,7 +300,15 @@ CORS_ALLOW_HEADERS = [
     "X-Requested-With"
 ]  # Ensures frontend can send required headers
 
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Sessions: "cached_db" reads through the cache above and only touches the
+# database on writes; "signed_cookies" keeps sessions out of the database
+# entirely (logging out then only clears the cookie); "db" is the stock engine.
+SESSION_BACKEND = os.getenv("DJANGO_SESSION_BACKEND", "cached_db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[SESSION_BACKEND]
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.sendgrid.net"
@@ -211,3 +317,6 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")  # Your full GoDaddy email address
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")  # App password or main password
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "Local <no-reply@experiencebylocals.com>")
+# Bulk sends go out in batches over one pooled connection (general/mail.py)
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", "0")) or None  # messages/second, unset = unlimited
@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from django.core.mail import send_mail
+from general.jobs import enqueue_email
 from django.http import HttpResponse
 import logging
 # Create your views here.
@@ -7,11 +7,9 @@ logger = logging.getLogger(__name__)
 
 def test_email_view(request):
     logger.info("🔥 Test email view was hit.")
-    send_mail(
+    enqueue_email(
         subject='Test Email from Local',
         message='This is a test message from your Django app.',
-        from_email=None,  # Uses DEFAULT_FROM_EMAIL
         recipient_list=['experiencebylocals@gmail.com'],
-        fail_silently=False,
     )
-    return HttpResponse("Test email sent!")
\ No newline at end of file
+    return HttpResponse("Test email queued!")
\ No newline at end of file
@@ -0,0 +1,11 @@
+#!/bin/sh
+# DJANGO_SERVER=asgi serves src.asgi under uvicorn workers (async read path);
+# anything else keeps the sync WSGI deployment.
+set -e
+
+python manage.py collectstatic --noinput
+
+if [ "$DJANGO_SERVER" = "asgi" ]; then
+    exec gunicorn --workers=4 --worker-class uvicorn_worker.UvicornWorker --timeout 120 --bind 0.0.0.0:5000 src.asgi:application
+fi
+exec gunicorn --workers=4 --threads=2 --timeout 120 --bind 0.0.0.0:5000 src.wsgi:application